@@ -1,93 +1,364 @@
 """
 This module
-1. connects to MySQL server and creates a SMK database and table containing selected artwork information
-2. imports string validated artwork information as JSON file to MySQL SMK table
-3. tests import of artwork information from MySQL SMK database into the script.
+1. connects to MySQL server and creates a SMK database and table containing selected artwork information;
+the connection settings come from the environment or smk.ini (see module SMKpool.py)
+2. imports string validated artwork information from the line-delimited JSON file written by
+SMKAPItoJSONstr.py (one artwork per line) to MySQL SMK table; artworks are bulk loaded in batches of
+multi-row INSERTs or, with load_data = True, with LOAD DATA LOCAL INFILE from a generated TSV file. Rows
+that fail to load are written to a reject file instead of aborting the import. Rows are upserted on the
+unique SMK id and rows whose content hash is unchanged are skipped, so importing the same file again
+leaves the table unchanged
+3. verifies the SMKentries table after the import: counts, a checksum and the artists with the most
+artworks are computed in the database and a bounded summary with a few sample rows is printed.
   
-Functions: string_valid(value)
+The schema of the SMK table is created and evolved by module SMKmigrations.py.
+
+Functions: read_entries(path), string_valid(value), clean_entry(item), row_hash(row), 
+changed_rows(cursor, batch), upsert_batch(connection, cursor, batch, reject), load_data_counts(cursor, written),
+bulk_load(connection, entries, batch_size, load_data, reject_path), verify(connection, sample, top_artists)
 """
-import pymysql 
 import codecs
 import json
-from tabulate import tabulate
 import sys
+import os
+import tempfile
+import time
+import hashlib
+import ast
+import re
+from SMKmetrics import metrics
+from SMKmigrations import migrate
+from SMKpool import db_config, create_database, get_pool
 
 
-def JSONtoMySQL():
+BATCH_SIZE = 1000
+REJECT_FILE = "SMKrejects.jsonl"
+LOAD_DATA_INFO = re.compile(r"(Records|Deleted|Skipped|Warnings): (\d+)")
+UPSERT_SQL = """INSERT INTO SMKentries (artist, frontend_url, id, production_date, image_iiif_id, content_hash) 
+                VALUES (%s,%s,%s,%s,%s,%s) 
+                ON DUPLICATE KEY UPDATE artist = VALUES(artist), frontend_url = VALUES(frontend_url), 
+                production_date = VALUES(production_date), image_iiif_id = VALUES(image_iiif_id), 
+                content_hash = VALUES(content_hash)"""
 
-    try:
-        """Connect to MySQL server and create SMK database."""
-        host = input("Please enter MySQL host name: ")
-        user = input("Please enter MySQL user: ")
-        passwd = input("Please enter MySQL password: ")
-        port = int(input("Please enter MySQL port: "))
-        connection = pymysql.connect(host = host, user = user, passwd = passwd, port = port)
+
+def read_entries(path = "SMKselstr.jsonl"):
+    """Yield the artworks of a line-delimited JSON file one at a time."""
+    with codecs.open(path, "r", "utf8") as f2in:
+        for line in f2in:
+            if line.strip():
+                yield json.loads(line)
+
+
+def string_valid(value):
+    """
+    Convert non-strings to strings in UTF-8 format which are returned; if input is a string the string 
+    is returned.
+    """
+    if value != None:
+        if type(value) is not str:
+            return str(value).encode('utf-8') 
+        else:
+            return value
+
+
+def clean_entry(item):
+    """
+    Take an artwork dictionary as argument, get() get the value of the specified key which is used as 
+    argument for def string_valid(value); returns the values as a tuple (artist, frontend_url, id, 
+    production_date, image_iiif_id) for import into MySQL database. Artist names written by older versions 
+    of SMKAPItoJSONstr.py as a stringified list ("['Heltoft, Ulrik']") are parsed and joined with "; ". 
+    Missing values, written as "None" by SMKAPItoJSONstr.py (e.g. an artwork without artist, production date 
+    or image), get NULL.
+    """
+    artist = string_valid(item.get("artist", None)) 
+    if artist in ("", "None"):
+        artist = None
+    if isinstance(artist, str) and artist.startswith("["):
+        artist = "; ".join(ast.literal_eval(artist))
+    frontend_url = string_valid(item.get("frontend_url", None))
+    id = string_valid(item.get("id", None))
+    production_date = string_valid(item.get("production_date", None))
+    if production_date in ("", "None"):
+        production_date = None
+    image_iiif_id = string_valid(item.get("image_iiif_id", None))
+    if image_iiif_id in ("", "None"):
+        image_iiif_id = None
+    return (artist, frontend_url, id, production_date, image_iiif_id)
+
+
+def tsv_field(value):
+    """Escape a value for a LOAD DATA file with tab separated fields (None is written as NULL)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def load_data_counts(cursor, written):
+    """
+    Return the counts MySQL reports for the LOAD DATA statement just executed on cursor as a dictionary with
+    the keys Records, Deleted, Skipped and Warnings ("Records: 3  Deleted: 0  Skipped: 0  Warnings: 0").
+    If the driver gives no such message, all written rows are counted as records.
+    """
+    result = getattr(cursor, "_result", None)
+    message = getattr(result, "message", None) or b""
+    if isinstance(message, bytes):
+        message = message.decode("utf-8", "replace")
+    counts = {"Records": written, "Deleted": 0, "Skipped": 0, "Warnings": getattr(result, "warning_count", 0)}
+    counts.update((key, int(value)) for key, value in LOAD_DATA_INFO.findall(message))
+    return counts
+
+
+def row_hash(row):
+    """Return a hash of the values of a cleaned artwork, used to skip rows that did not change."""
+    values = (value.decode("utf-8") if isinstance(value, bytes) else str(value) for value in row)
+    return hashlib.sha1("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+def changed_rows(cursor, batch):
+    """Return the (item, row, hash) tuples of a batch whose id is new or whose content hash changed."""
+    ids = [row[2] for item, row, content_hash in batch]
+    with metrics().timer("smk_db_query_seconds", query = "changed_rows"):
+        cursor.execute("SELECT id, content_hash FROM SMKentries WHERE id IN (%s)" % ",".join(["%s"] * len(ids)), 
+                       ids)
+        stored = dict(cursor.fetchall())
+    return [entry for entry in batch if stored.get(entry[1][2]) != entry[2]]
+
+
+def upsert_batch(connection, cursor, batch, reject):
+    """
+    Upsert a batch of (item, row, hash) tuples with one executemany() and commit it; return the number of
+    rows loaded. If the batch fails, its rows are retried one at a time and the rows that still fail are
+    passed to reject(item, error).
+    """
+    if not batch:
+        return 0
+    loaded = 0
+    with metrics().timer("smk_load_batch_seconds", method = "executemany"):
+        try:
+            cursor.executemany(UPSERT_SQL, [row + (content_hash,) for item, row, content_hash in batch])
+            connection.commit()
+            loaded = len(batch)
+        except Exception as e:
+            connection.rollback()
+            print(f"A batch of {len(batch)} rows failed ({e}); retrying the rows one at a time.")
+            for item, row, content_hash in batch:
+                try:
+                    cursor.execute(UPSERT_SQL, row + (content_hash,))
+                    connection.commit()
+                    loaded += 1
+                except Exception as e:
+                    connection.rollback()
+                    reject(item, e)
+    return loaded
+
+
+def bulk_load(connection, entries, batch_size = BATCH_SIZE, load_data = False, reject_path = REJECT_FILE):
+    """
+    Upsert artwork dictionaries into the SMKentries table and return a tuple (loaded, skipped, rejected).
+
+    Rows whose content hash matches the stored row are skipped. The other rows are upserted on the unique
+    id batch_size at a time with executemany(), which PyMySQL sends as one multi-row 
+    INSERT ... ON DUPLICATE KEY UPDATE, and every batch is committed on its own. If a batch fails, its rows
+    are retried one at a time and the rows that still fail are written with the error to reject_path. With
+    load_data = True the rows are written to a temporary TSV file and loaded with 
+    LOAD DATA LOCAL INFILE ... REPLACE (the connection must be opened with local_infile = True); the rows
+    loaded and rejected are then counted from the records and skipped rows MySQL reports, and its warnings
+    (e.g. truncated values of rows that were loaded) are written to reject_path without counting the rows
+    as rejected. Batch latencies, transform time and row counts are recorded in the metrics (module
+    SMKmetrics.py).
+    """
+    start = time.perf_counter()
+    loaded = 0
+    skipped = 0
+    rejected = 0
+    cursor = connection.cursor()
+
+    with codecs.open(reject_path, "w", "utf8") as reject_out:
+
+        def reject(item, error):
+            nonlocal rejected
+            rejected += 1
+            reject_out.write(json.dumps({"entry": item, "error": str(error)}, ensure_ascii = False) + "\n")
+
+        def warn(warning):
+            reject_out.write(json.dumps({"entry": None, "warning": " ".join(str(value) for value in warning)},
+                                        ensure_ascii = False) + "\n")
+
+        def batches():
+            """
+            Yield lists of (item, row, hash) tuples of new or changed rows; items that cannot be converted
+            are rejected.
+            """
+            nonlocal skipped
+            batch = []
+            transform_seconds = 0.0
+            for item in entries:
+                transform_start = time.perf_counter()
+                try:
+                    row = clean_entry(item)
+                    batch.append((item, row, row_hash(row)))
+                except Exception as e:
+                    reject(item, e)
+                    continue
+                finally:
+                    transform_seconds += time.perf_counter() - transform_start
+                if len(batch) == batch_size:
+                    metrics().observe("smk_transform_seconds", transform_seconds, stage = "clean_entry")
+                    transform_seconds = 0.0
+                    changed = changed_rows(cursor, batch)
+                    skipped += len(batch) - len(changed)
+                    yield changed
+                    batch = []
+            if batch:
+                metrics().observe("smk_transform_seconds", transform_seconds, stage = "clean_entry")
+                changed = changed_rows(cursor, batch)
+                skipped += len(batch) - len(changed)
+                yield changed
+
+        if load_data:
+            fd, tsv_path = tempfile.mkstemp(suffix = ".tsv")
+            written = 0
+            try:
+                with open(fd, "w", encoding = "utf8", newline = "\n") as tsv_out:
+                    for batch in batches():
+                        for item, row, content_hash in batch:
+                            tsv_out.write("\t".join(tsv_field(value) for value in row + (content_hash,)) + "\n")
+                            written += 1
+                with metrics().timer("smk_load_batch_seconds", method = "load_data"):
+                    cursor.execute("""LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE SMKentries CHARACTER SET utf8mb4 
+                                   FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' 
+                                   (artist, frontend_url, id, production_date, image_iiif_id, content_hash)""", 
+                                   (tsv_path,))
+                    # REPLACE counts a replaced row twice in the affected rows, so count from the info message
+                    counts = load_data_counts(cursor, written)
+                    loaded += counts["Records"] - counts["Skipped"]
+                    rejected += counts["Skipped"]
+                    if counts["Warnings"]:
+                        cursor.execute("SHOW WARNINGS")
+                        for warning in cursor.fetchall():
+                            warn(warning)
+                        print(f"LOAD DATA reported {counts['Warnings']} warnings (see {reject_path})")
+                    connection.commit()
+            finally:
+                os.unlink(tsv_path)
+
+        else:
+            for batch in batches():
+                loaded += upsert_batch(connection, cursor, batch, reject)
+
+    elapsed = time.perf_counter() - start
+    for result, count in (("loaded", loaded), ("skipped", skipped), ("rejected", rejected)):
+        metrics().inc("smk_load_rows_total", count, result = result)
+    metrics().set("smk_load_rows_per_second", round(loaded / elapsed if elapsed else 0))
+    print(f"Loaded {loaded} rows in {elapsed:.2f} s ({loaded / elapsed if elapsed else 0:.0f} rows/sec), "
+          f"{skipped} unchanged rows skipped, {rejected} rejected (see {reject_path})")
+    cursor.close()
+    return loaded, skipped, rejected
+
+
+def verify(connection, sample = 10, top_artists = 10):
+    """
+    Check the SMKentries table after a load and print a bounded summary; return it as a dictionary. The
+    counts and the checksum are computed in the database in one pass: rows, distinct ids (a difference
+    means duplicate rows), artists, rows without artist, image or content hash, and the XOR of the first 64
+    bits of every content hash, which does not depend on the row order and changes when any row changes.
+    The artists with the most artworks are read with an unbuffered server-side cursor and sample rows spread
+    evenly over the table are read by primary key, so neither the memory nor the output grows with the table.
+    """
+    import pymysql
+
+    cursor = connection.cursor()
+    with metrics().timer("smk_db_query_seconds", query = "verify_summary"):
+        cursor.execute("""SELECT COUNT(*), COUNT(DISTINCT id), COUNT(DISTINCT artist), SUM(artist IS NULL), 
+                       SUM(image_iiif_id IS NULL), SUM(content_hash IS NULL), 
+                       BIT_XOR(CAST(CONV(LEFT(content_hash, 16), 16, 10) AS UNSIGNED)), MIN(entry), MAX(entry) 
+                       FROM SMKentries""")
+        rows, ids, artists, no_artist, no_image, no_hash, checksum, first, last = cursor.fetchone()
+    summary = {"rows": rows, "duplicate_ids": rows - ids, "artists": artists, "without_artist": int(no_artist or 0),
+               "without_image": int(no_image or 0), "without_hash": int(no_hash or 0),
+               "checksum": f"{int(checksum or 0):016x}"}
+    cursor.close()
+
+    with metrics().timer("smk_db_query_seconds", query = "verify_artists"):
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        cursor.execute("""SELECT artist, COUNT(*) AS artworks FROM SMKentries WHERE artist IS NOT NULL 
+                       GROUP BY artist ORDER BY artworks DESC, artist LIMIT %s""", (top_artists,))
+        summary["top_artists"] = [(artist, count) for artist, count in cursor]
+        cursor.close()
+
+    summary["sample"] = []
+    count = min(sample, rows)
+    if count:
         cursor = connection.cursor()
+        with metrics().timer("smk_db_query_seconds", query = "verify_sample"):
+            for i in range(count):
+                cursor.execute("""SELECT artist, id, production_date FROM SMKentries WHERE entry >= %s 
+                               ORDER BY entry LIMIT 1""", (first + (last - first) * i // max(count - 1, 1),))
+                summary["sample"].append(cursor.fetchone())
+        cursor.close()
+
+    for key in ("rows", "duplicate_ids", "artists", "without_artist", "without_image", "without_hash"):
+        metrics().set("smk_verify_" + key, summary[key])
+    print(f"SMKentries: {rows} rows, {artists} artists, checksum {summary['checksum']}")
+    print(f"  {summary['duplicate_ids']} duplicate ids, {summary['without_artist']} rows without artist, "
+          f"{summary['without_image']} without image, {summary['without_hash']} without content hash")
+    print("  Artists with the most artworks:")
+    for artist, count in summary["top_artists"]:
+        print(f"    {count:>6}  {artist}")
+    print("  Sample rows (artist, id, production_date):")
+    for row in summary["sample"]:
+        print(f"    {row}")
+    return summary
+
 
-        cursor.execute("CREATE DATABASE IF NOT EXISTS SMK1")
-        cursor.execute("SHOW DATABASES")
-        for db in cursor:
-            print(db) 
+def JSONtoMySQL(path = "SMKselstr.jsonl", batch_size = BATCH_SIZE, load_data = False, config = None,
+                raise_errors = False):
+    """
+    Import the artworks in path into the SMKentries table and return the shared connection pool (module 
+    SMKpool.py). Artworks are upserted on their id, so path may hold the whole collection or only new or 
+    changed artworks (see APItoJSON(incremental = True)). See bulk_load for batch_size and load_data.
+    config holds the MySQL settings (read with db_config() if None). Load errors are printed; with
+    raise_errors = True they are raised after printing.
+    """
+
+    try:
+        """Read the MySQL settings from the environment or smk.ini and create SMK database."""
+        if config is None:
+            config = db_config()
+        create_database(config)
+        pool = get_pool(config, local_infile = load_data)
 
     except Exception as e:
         print("Something went wrong with the database connection. Please try again.")
         sys.exit(1)
 
-    try:
-        """Connect to MySQL SMK1 database and create SMKentries table."""
-        createtable = """CREATE TABLE IF NOT EXISTS SMKentries (entry INT AUTO_INCREMENT PRIMARY KEY, 
-        artist VARCHAR(100), frontend_url VARCHAR(2048), id VARCHAR(50), production_date VARCHAR(20))"""
-        connection = pymysql.connect(host = host, user = user, passwd = passwd, port = port, db = "SMK1")
-        cursor = connection.cursor() 
-        cursor.execute(createtable)
-        cursor.execute("SHOW TABLES")
-        for t in cursor:
-            print(t)
+    with pool.connection() as connection:
+        try:
+            """Create or migrate SMKentries table."""
+            cursor = connection.cursor() 
+            migrate(connection)
+            cursor.execute("SHOW TABLES")
+            for t in cursor:
+                print(t)
 
-    except Exception as e:
-        print("Something went wrong with creating the table. Please try again.")
-
-
-    # import JSON file containing artwork information
-    with codecs.open("SMKselstr.json", "r") as f2in:
-        data = json.load(f2in)
-
-
-    def string_valid(value):
-        """
-        Convert non-strings to strings in UTF-8 format which are returned; if input is a string the string 
-        is returned.
-        """
-        if value != None:
-            if type(value) is not str:
-                return str(value).encode('utf-8') 
-            else:
-                return value
-
-    try: 
-        """
-        Take an interable object (here: list of dictionaries in JSON file) as argument, remove brackets 
-        from artist name, get() get the value of the specified key which is used as argument for def string_
-        valid(value), returned values are imported into MySQL database.
-        """
-        for i, item in enumerate(data):
-            init_artist = string_valid(item.get("artist", None)) 
-            artist = (init_artist.replace("[", "").replace("]", "").replace("\'", "")) 
-            frontend_url = string_valid(item.get("frontend_url", None))
-            id = string_valid(item.get("id", None))
-            production_date = string_valid(item.get("production_date", None))
-
-            cursor.execute("""INSERT INTO SMKentries (artist, frontend_url, id, production_date) 
-                        VALUES (%s,%s,%s,%s)""", (artist, frontend_url, id, production_date))   
-        connection.commit()
+        except Exception as e:
+            print("Something went wrong with creating the table. Please try again.")
 
-    except Exception as e:
-        print(e)
+
+        try: 
+            """Bulk load the dictionaries read line by line from the JSON file into MySQL database."""
+            bulk_load(connection, read_entries(path), batch_size = batch_size, load_data = load_data)
+
+        except Exception as e:
+            print(e)
+            if raise_errors:
+                raise
 
 
-    # test import of data from MySQL database 
-    cursor.execute("SELECT artist, id, production_date FROM SMKentries")
-    result = cursor.fetchall()
-    print(tabulate(result, headers = ["artist", "id", "production_date"], tablefmt = "psql"))
+        # check the imported data in the MySQL database 
+        cursor.close()
+        verify(connection)
 
-    return connection
\ No newline at end of file
+    return pool
@@ -1,71 +1,330 @@
 """
 This module
 1. fetches information on 2000 artworks from the Statens Museum for Kunst/SMK (National Gallery of Denmark)
-via the SMK API as a JSON file
-2. selects artwork id, name of artist, production date and image url for each artwork from the JSON file
-and stores the list of dictionaries as a JSON file and 
-3. converts all values of the dictionaries to string type and save them as a JSON file for import into a 
-MySQL database.
+via the SMK API; with full = True the whole collection is harvested in offset/rows pages that are fetched
+concurrently over a shared keep-alive session
+2. parses the artworks incrementally from each response body and selects artwork id, name of artist,
+production date, image url and IIIF image identifier for each artwork and
+3. converts all values to string type and writes one JSON object per line (SMKselstr.jsonl) for import
+into a MySQL database, in a single pass and without holding whole responses in memory.
+
+requests is imported when the first session is made, so the constants and parsing functions of this module
+can be imported without it.
+
+With debug = True the raw items (SMK.jsonl) and the selected, not yet string converted values
+(SMKsel.jsonl) are written as well. With incremental = True only new or changed artworks are written: a
+local checkpoint (SMKcheckpoint.json) keeps a content hash per loaded artwork and the offset of the last
+completed page, so that an interrupted harvest resumes from that page. The hashes of a harvest stay pending
+until its output has been loaded (commit_checkpoint), so the changes of a harvest that is never loaded are
+written again by the next one. A ResponseCache (module SMKcache.py) can be
+passed as cache to serve repeated queries from disk.
+
+Functions: iter_items(chunks, header), select_fields(item), stringify(record), record_hash(record),
+load_checkpoint(path), save_checkpoint(checkpoint, path), commit_checkpoint(output, path),
+fetch_records(session, offset, rows, keep_raw, cache, api_url),
+iter_pages(full, max_workers, rows, keep_raw, start, cache, api_url)
 """
-import requests 
 import json
 import codecs
+import re
+import os
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from SMKmetrics import metrics
 
-def APItoJSON():
 
-    try:
-        """Requesting a response from the SMK server/API using the HTTP library requests."""
-        response = requests.get("https://api.smk.dk/api/v1/art/search/?keys=*&offset=0&rows=2000&lang=en")
-    except requests.exceptions.HTTPError as http:
-        print ("Http error:",http)
-    except requests.exceptions.ConnectionError as conn:
-        print ("Connection error:",conn)
-    except requests.exceptions.Timeout as time:
-        print ("Timeout error:",time)
-    except requests.exceptions.RequestException as other:
-        print ("Another error",other)
+# the SMK API search endpoint; SMK_API_URL points the harvest at another server (e.g. SMKfakeapi.py)
+API_URL = os.environ.get("SMK_API_URL", "https://api.smk.dk/api/v1/art/search/")
+PAGE_ROWS = 2000
+MAX_WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+OUTPUT_FILE = "SMKselstr.jsonl"
+CHECKPOINT_FILE = "SMKcheckpoint.json"
+
+ITEMS_START = re.compile(r'"items"\s*:\s*\[')
+HEADER_FIELD = re.compile(r'"(offset|rows|found)"\s*:\s*(\d+)')
+
+
+def iter_items(chunks, header = None):
+    """
+    Yield the artworks of the "items" array of an SMK API response one at a time. The body is given as
+    an iterable of byte chunks and decoded incrementally, so only the current item is held in memory.
+    If a dictionary is passed as header, the numeric top-level fields before the array ("offset",
+    "rows", "found") are stored in it.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = -1
+
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        if position < 0:
+            match = ITEMS_START.search(buffer)
+            if match is None:
+                continue
+            if header is not None:
+                header.update((key, int(value)) for key, value in HEADER_FIELD.findall(buffer[:match.start()]))
+            position = match.end()
+
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                item, position_end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # the item is not complete yet, read the next chunk
+                break
+            yield item
+            position = position_end
+
+        buffer = buffer[position:]
+        position = 0
+
+    if position < 0:
+        raise ValueError("The SMK API response contains no items.")
+    raise ValueError("The SMK API response ended in the middle of the items.")
+
+
+def select_fields(item):
+    """
+    Select name of artist, id, image url, production date and IIIF image identifier of an artwork. Several
+    artists are joined with "; " since a single name is already written "Last, First".
+    """
+    production_date = item.get("production_date") or [{}]
+    artist = item.get("artist")
+    if isinstance(artist, list):
+        artist = "; ".join(artist)
+    return {"id": item.get("id"), "artist": artist, "frontend_url": item.get("frontend_url"),
+            "production_date": production_date[0].get("period"), "image_iiif_id": item.get("image_iiif_id")}
+
+
+def stringify(record):
+    """Convert the values of a dictionary to strings (keys are always strings)."""
+    return {key: str(value) for key, value in record.items()}
+
 
+def record_hash(record):
+    """Return a hash of the content of a selected artwork, used to detect changed artworks."""
+    return hashlib.sha1(json.dumps(record, sort_keys = True, ensure_ascii = False).encode("utf-8")).hexdigest()
 
-    # store artwork information provided by the SMK as a list of dictionaries as JSON file
-    response = response.json()
-    with open("SMK.json", "w") as f1out:
-        json.dump(response, f1out)
 
-    with open("SMK.json", "r") as f1in:
-        SMKdict = json.load(f1in)
+def load_checkpoint(path = CHECKPOINT_FILE):
+    """
+    Return the harvest checkpoint stored in path: the offset of the next page to fetch, whether the last
+    harvest completed, the content hash of every artwork loaded so far ("hashes") and the hashes of the new
+    or changed artworks of the last harvest, written to "output" but not yet loaded ("pending").
+    """
+    checkpoint = {"next_offset": 0, "complete": True, "hashes": {}, "pending": {}, "output": None}
+    if os.path.exists(path):
+        with codecs.open(path, "r", "utf8") as fin:
+            checkpoint.update(json.load(fin))
+    return checkpoint
 
 
-    # select name of artist, id, image url and production date for each artwork from JSON file and store as 
-    # list of dictionaries
-    SMKselkeys = []
-    for dictionary in SMKdict["items"]:
-        SMKselkeys.append({"id":dictionary["id"], "artist":dictionary["artist"], "frontend_url":dictionary["frontend_url"],
-        "production_date":dictionary["production_date"][0]["period"]})  
-    print(SMKselkeys) 
+def save_checkpoint(checkpoint, path = CHECKPOINT_FILE):
+    """Write the harvest checkpoint to path; the file is replaced atomically so it is never left half written."""
+    temp_path = path + ".tmp"
+    with codecs.open(temp_path, "w", "utf8") as fout:
+        json.dump(checkpoint, fout, ensure_ascii = False)
+    os.replace(temp_path, path)
 
 
-    # write artwork information to JSON file
-    with codecs.open("SMKsel.json", "w", "utf8") as f2out:
-        f2out.write(json.dumps(SMKselkeys, sort_keys = True, ensure_ascii=False))
+def commit_checkpoint(output = OUTPUT_FILE, path = CHECKPOINT_FILE):
+    """
+    Record the pending hashes of the last incremental harvest as loaded, after output has been loaded into
+    the database, and return their number. Nothing is recorded if the last harvest was written elsewhere.
+    """
+    checkpoint = load_checkpoint(path)
+    if not checkpoint["pending"] or checkpoint["output"] != os.path.abspath(output):
+        return 0
+    count = len(checkpoint["pending"])
+    checkpoint["hashes"].update(checkpoint["pending"])
+    checkpoint["pending"] = {}
+    save_checkpoint(checkpoint, path)
+    return count
 
-    with codecs.open("SMKsel.json", "r") as f2in:
-        data = json.load(f2in)
-    print(data)
-    
 
-    # convert values in dictionaries to strings (keys are always strings)
-    for i in data:
-        for key, value in i.items():
-            i.update({key: str(value)})
+def make_session(max_workers = MAX_WORKERS):
+    """Return a requests session that keeps up to max_workers connections alive."""
+    import requests
 
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections = max_workers, pool_maxsize = max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-    # write string converted items of list of dictionaries to JSON file
-    with codecs.open("SMKselstr.json", "w", "utf8") as f2out:
-        f2out.write(json.dumps(data, sort_keys = True, ensure_ascii=False))
 
-    with codecs.open("SMKselstr.json", "r") as f2in:
-        data = json.load(f2in)
-    print(data)  
+def fetch_records(session, offset, rows = PAGE_ROWS, keep_raw = False, cache = None, api_url = API_URL):
+    """
+    Stream one offset/rows page of the SMK collection from api_url and return a tuple (found, records, raw):
+    the size of the collection, the selected and string converted artworks of the page and, with
+    keep_raw = True, the raw items (otherwise None). If a ResponseCache is given, the page is read from the
+    cache instead.
+    """
+    params = {"keys": "*", "offset": offset, "rows": rows, "lang": "en"}
+    header = {}
+    records = []
+    raw = [] if keep_raw else None
+    source = "network" if cache is None else "cache"
+    transform_seconds = 0.0
+
+    def counted(chunks):
+        for chunk in chunks:
+            metrics().inc("smk_http_response_bytes_total", len(chunk), source = source)
+            yield chunk
+
+    def parse(chunks):
+        nonlocal transform_seconds
+        for item in iter_items(counted(chunks), header):
+            start = time.perf_counter()
+            records.append(stringify(select_fields(item)))
+            transform_seconds += time.perf_counter() - start
+            if keep_raw:
+                raw.append(item)
+
+    with metrics().timer("smk_http_request_seconds", source = source):
+        if cache is not None:
+            with cache.open(session, api_url, params) as fin:
+                parse(iter(lambda: fin.read(CHUNK_SIZE), b""))
+        else:
+            with session.get(api_url, params = params, timeout = 60, stream = True) as response:
+                response.raise_for_status()
+                parse(response.iter_content(CHUNK_SIZE))
+    metrics().observe("smk_transform_seconds", transform_seconds, stage = "select_fields")
+    metrics().inc("smk_harvest_records_total", len(records))
+    return header.get("found", offset + len(records)), records, raw
+
+
+def iter_pages(full = False, max_workers = MAX_WORKERS, rows = PAGE_ROWS, keep_raw = False, start = 0,
+               cache = None, api_url = API_URL):
+    """
+    Yield (offset, records, raw) for every page from offset start on, in offset order. The first page is
+    fetched on its own to learn the size of the collection; with full = True the remaining pages are
+    fetched concurrently by max_workers threads, with at most max_workers pages in flight at any time.
+    """
+    with make_session(max_workers) as session:
+        found, records, raw = fetch_records(session, start, rows, keep_raw, cache, api_url)
+        yield start, records, raw
+        if not full:
+            return
+
+        offsets = iter(range(start + rows, found, rows))
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            pending = deque()
+            for offset in offsets:
+                pending.append((offset, executor.submit(fetch_records, session, offset, rows, keep_raw, cache,
+                                                        api_url)))
+                if len(pending) == max_workers:
+                    break
+            while pending:
+                offset, future = pending.popleft()
+                _, records, raw = future.result()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending.append((next_offset, executor.submit(fetch_records, session, next_offset, rows,
+                                                                 keep_raw, cache, api_url)))
+                yield offset, records, raw
+
+
+def APItoJSON(full = False, max_workers = MAX_WORKERS, debug = False, output = OUTPUT_FILE,
+              incremental = False, checkpoint_path = CHECKPOINT_FILE, cache = None, raise_errors = False,
+              api_url = API_URL):
+    """
+    Harvest artworks from the SMK API at api_url and write them as line-delimited JSON to output. Returns the
+    number of artworks written.
+
+    With incremental = True only artworks whose content hash differs from the last loaded one in the checkpoint
+    are written. The checkpoint is saved after every completed page; if the previous incremental harvest did not
+    complete, it is resumed from the next page and output is appended to instead of overwritten. The new hashes
+    stay pending until commit_checkpoint is called after output has been loaded, so a harvest whose output was
+    not loaded (or failed to load) is written again, together with any newer changes, by the next one.
+
+    Request errors are printed; with raise_errors = True they are raised after printing, so a caller can
+    tell a complete harvest from an interrupted one.
+    """
+    import requests
+
+    count = 0
+    debug_files = []
+    start = 0
+    mode = "w"
+    if incremental:
+        checkpoint = load_checkpoint(checkpoint_path)
+        if not checkpoint["complete"] and checkpoint["next_offset"] > 0:
+            start = checkpoint["next_offset"]
+            mode = "a"
+            print(f"Resuming the interrupted harvest at offset {start}")
+        else:
+            checkpoint["pending"] = {}
+        checkpoint["complete"] = False
+        checkpoint["output"] = os.path.abspath(output)
+        hashes = checkpoint["hashes"]
+        pending = checkpoint["pending"]
+    try:
+        """Requesting a response from the SMK server/API using the HTTP library requests."""
+        with codecs.open(output, mode, "utf8") as fout:
+            if debug:
+                raw_out = codecs.open("SMK.jsonl", "w", "utf8")
+                sel_out = codecs.open("SMKsel.jsonl", "w", "utf8")
+                debug_files = [raw_out, sel_out]
+
+            for offset, records, raw in iter_pages(full = full, max_workers = max_workers, keep_raw = debug,
+                                                   start = start, cache = cache, api_url = api_url):
+                if incremental:
+                    changed = []
+                    for record in records:
+                        content_hash = record_hash(record)
+                        if hashes.get(record["id"]) != content_hash:
+                            pending[record["id"]] = content_hash
+                            changed.append(record)
+                    print(f"{len(changed)} of {len(records)} artworks are new or changed (page at offset {offset})")
+                    records = changed
+                for record in records:
+                    fout.write(json.dumps(record, sort_keys = True, ensure_ascii = False) + "\n")
+                if debug:
+                    for item in raw:
+                        raw_out.write(json.dumps(item, ensure_ascii = False) + "\n")
+                        sel_out.write(json.dumps(select_fields(item), sort_keys = True, ensure_ascii = False)
+                                      + "\n")
+                count += len(records)
+                print(f"Fetched {count} artworks (page at offset {offset})")
+                if incremental:
+                    fout.flush()
+                    checkpoint["next_offset"] = offset + PAGE_ROWS
+                    save_checkpoint(checkpoint, checkpoint_path)
+
+        if incremental:
+            checkpoint["complete"] = True
+            checkpoint["next_offset"] = 0
+            save_checkpoint(checkpoint, checkpoint_path)
+
+    except requests.exceptions.HTTPError as http:
+        print ("Http error:",http)
+        if raise_errors:
+            raise
+    except requests.exceptions.ConnectionError as conn:
+        print ("Connection error:",conn)
+        if raise_errors:
+            raise
+    except requests.exceptions.Timeout as timeout:
+        print ("Timeout error:",timeout)
+        if raise_errors:
+            raise
+    except requests.exceptions.RequestException as other:
+        print ("Another error",other)
+        if raise_errors:
+            raise
+    finally:
+        for f in debug_files:
+            f.close()
 
-    
\ No newline at end of file
+    return count
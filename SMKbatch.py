@@ -0,0 +1,134 @@
+"""
+This module processes artwork images in batch, without user interaction. The artworks are selected by
+artist or by id from the SMKentries table, every image is fetched through the image cache (see module
+SMKcache.py), a list of operations (contrast, brightness, sharpness, resize) is applied in one fused pass
+(see module SMKediting.py) and the result is written to an output directory. The images are processed in
+parallel on a pool of processes, one per core by default; the time taken and any failure are reported per
+image and written to report.json in the output directory.
+
+Run this module to process a collection from the command line, for example:
+python SMKbatch.py --artist "Heltoft, Ulrik" --operations contrast=1.5,sharpness=2,resize=512 --output out
+
+Functions: process_image(job), select_artworks(pool, artists, ids), process_batch(artworks, operations, output_dir, workers, full), main()
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pymysql
+from PIL import Image
+
+from SMKcache import image_cache
+from SMKediting import apply_operations, parse_operations
+from SMKimages import display_url, full_url
+from SMKmetrics import metrics
+from SMKpool import CONFIG_FILE, db_config, get_pool
+
+
+def process_image(job):
+    """
+    Processes one image in a worker process. job is a tuple (id, iiif_id, operations, output_dir, full);
+    returns a dictionary with the id, the output path or the error and the seconds taken.
+    """
+    id, iiif_id, operations, output_dir, full = job
+    start = time.perf_counter()
+    result = {"id": id}
+    try:
+        url = full_url(iiif_id) if full else display_url(iiif_id)
+        box = min((value for name, value in operations if name == "resize"), default = None)
+        with Image.open(image_cache().path(url)) as image:
+            if box is not None:
+                # let the JPEG decoder scale down while decoding when the output is smaller anyway
+                image.draft("RGB", (box, box))
+            processed = apply_operations(image.convert("RGB"), operations)
+        path = os.path.join(output_dir, re.sub(r"[^\w.-]", "_", id) + ".jpg")
+        processed.save(path, "JPEG", quality = 90)
+        result["path"] = path
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def select_artworks(pool, artists = (), ids = ()):
+    """Returns a list of (id, iiif_id) tuples of the artworks with an image by the given artists or with the given ids."""
+    conditions = []
+    args = []
+    if artists:
+        conditions.append("artist IN (%s)" % ",".join(["%s"] * len(artists)))
+        args.extend(artists)
+    if ids:
+        conditions.append("id IN (%s)" % ",".join(["%s"] * len(ids)))
+        args.extend(ids)
+    if not conditions:
+        return []
+    with pool.connection() as connection:
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        cursor.execute(f"""SELECT id, image_iiif_id FROM SMKentries WHERE image_iiif_id IS NOT NULL
+                       AND ({' OR '.join(conditions)}) ORDER BY id""", args)
+        artworks = list(cursor)
+        cursor.close()
+    return artworks
+
+
+def process_batch(artworks, operations, output_dir, workers = None, full = False):
+    """
+    Processes the images of a list of (id, iiif_id) tuples on a pool of worker processes (one per core by
+    default) and writes them to output_dir. Returns the list of results of process_image, which is also
+    written to output_dir/report.json.
+    """
+    os.makedirs(output_dir, exist_ok = True)
+    jobs = [(id, iiif_id, operations, output_dir, full) for id, iiif_id in artworks]
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        for result in executor.map(process_image, jobs, chunksize = 4):
+            results.append(result)
+            # the worker processes have their own metrics; the timings are recorded here from the results
+            metrics().observe("smk_image_process_seconds", result["seconds"],
+                              result = "failed" if "error" in result else "ok")
+            if "error" in result:
+                print(f"{result['id']}: FAILED after {result['seconds']:.2f} s ({result['error']})")
+            else:
+                print(f"{result['id']}: {result['seconds']:.2f} s -> {result['path']}")
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for result in results if "error" in result)
+    print(f"Processed {len(results) - failed} images in {elapsed:.2f} s, {failed} failed")
+    with open(os.path.join(output_dir, "report.json"), "w") as fout:
+        json.dump({"operations": operations, "seconds": round(elapsed, 3), "results": results}, fout, indent = 1)
+    return results
+
+
+def main():
+    """
+    Processes the images selected on the command line and returns the exit status. The MySQL settings are never
+    asked for, so the batch can run from cron; a missing setting is reported with exit status 2.
+    """
+    parser = argparse.ArgumentParser(description = "Process artwork images in batch.")
+    parser.add_argument("--artist", action = "append", default = [], help = "artist as stored, e.g. 'Heltoft, Ulrik'")
+    parser.add_argument("--id", action = "append", default = [], help = "artwork id")
+    parser.add_argument("--operations", required = True, type = parse_operations,
+                        help = "e.g. contrast=1.5,brightness=1.1,sharpness=2,resize=512")
+    parser.add_argument("--output", default = "SMKprocessed", help = "output directory")
+    parser.add_argument("--workers", type = int, default = None, help = "number of processes (default: cores)")
+    parser.add_argument("--full", action = "store_true", help = "process the full resolution images")
+    parser.add_argument("--config", default = CONFIG_FILE, help = "config file with a [mysql] section")
+    args = parser.parse_args()
+
+    try:
+        pool = get_pool(db_config(args.config, interactive = False))
+    except ValueError as e:
+        print(e)
+        return 2
+    artworks = select_artworks(pool, args.artist, args.id)
+    print(f"{len(artworks)} artworks with an image selected")
+    process_batch(artworks, args.operations, args.output, args.workers, args.full)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,459 @@
+"""
+This module measures how parts of the project scale with the size of the collection.
+
+1. bench_artwork_collection(sizes) adds artworks to an Artist, looks them up by name and deletes half of
+them one by one, and compares the ArtworkCollection of SMKinteraction.py with the dictionary that was
+renumbered after every delete before.
+2. bench_memory(sizes) holds n artworks of SMK-like data in memory, spread over a long tail of artists as in
+the SMK collection, as plain objects with a __dict__ per artwork (as Artwork was before) and as views of the
+columnar store of SMKcolumnar.py shared by all artists, and compares the memory allocated with tracemalloc.
+3. bench_stages(sizes, config) runs the stages of the project on synthetic collections of n artworks: the
+harvest (APItoJSON) from a local stand-in of the SMK API (module SMKfakeapi.py), the transform of the
+harvested file into table rows, the load (bulk_load) into MySQL or, without MySQL settings, into a stand-in
+connection that only consumes the statements, the pipelined harvest and load of module SMKpipeline.py
+(which should take about as long as the slower of harvest and load), the startup of the Menu and the
+writing of a snapshot and startup of the Menu on it (module SMKsnapshot.py). Wall
+time, throughput and peak memory (traced with tracemalloc, which slows every stage down alike) are reported
+per stage and saved as JSON, and compare_results compares a run with an earlier one to find regressions.
+
+4. bench_imports(modules, budget_ms) checks that interface.py and SMKinteraction.py import within a time
+budget (measured with python -X importtime) and without loading the modules only some paths need (PIL,
+requests, pymysql, webbrowser).
+
+Run this module to print the results: python SMKbenchmark.py, or python SMKbenchmark.py --stages
+[--mysql] [--sizes 2000 20000 200000] [--baseline SMKbench_old.json], or python SMKbenchmark.py --imports
+[--budget-ms 100], which exits with status 1 if a module is over budget.
+
+Functions: legacy_delete(artworks_dictionary, artwork_name), bench_artwork_collection(sizes),
+artist_sizes(per_artist), smk_rows(n, per_artist), bench_memory(sizes, per_artist), measure(function),
+bench_stages(sizes, config, output), compare_results(baseline, results, tolerance), import_time(module, repeat),
+bench_imports(modules, budget_ms), main(argv)
+Classes: LegacyArtwork, NullCursor, NullConnection, NullPool
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from SMKcolumnar import ArtworkStore
+from SMKinteraction import Artist, Artwork, Menu, User
+
+
+# database the stage benchmark loads into and empties; never the configured one (SMK_MYSQL_DB or smk.ini)
+BENCH_DATABASE = "SMKbench"
+
+def legacy_delete(artworks_dictionary, artwork_name):
+    """Deletes an artwork the way Artist.delete_artwork did before: scan by name, then renumber all keys."""
+    for key in artworks_dictionary:
+        if artworks_dictionary[key].artwork_name == artwork_name:
+            del artworks_dictionary[key]
+            break
+    return dict(enumerate(artworks_dictionary.values()))
+
+
+def bench_artwork_collection(sizes = (1000, 10000)):
+    """
+    Times adding n artworks, looking each up by name and deleting every second one for each n in sizes.
+    Returns a list of dictionaries with the timings in seconds.
+    """
+    results = []
+    for n in sizes:
+        artist = Artist("Benchmark Artist")
+        artworks = [Artwork(artist, f"Artwork {i}", str(i), "2000") for i in range(n)]
+        deleted = [artwork.artwork_name for artwork in artworks[::2]]
+
+        start = time.perf_counter()
+        artist.add_artworks(artworks)
+        added = time.perf_counter()
+        for artwork in artworks:
+            artist.artworks_dictionary.handle_of(artwork.artwork_name)
+        looked_up = time.perf_counter()
+        for artwork_name in deleted:
+            artist.artworks_dictionary.delete_name(artwork_name)
+        collection_delete = time.perf_counter() - looked_up
+
+        legacy = dict(enumerate(artworks))
+        start_legacy = time.perf_counter()
+        for artwork_name in deleted:
+            legacy = legacy_delete(legacy, artwork_name)
+        legacy_time = time.perf_counter() - start_legacy
+
+        result = {"artworks": n, "add": added - start, "lookup": looked_up - added,
+                  "delete": collection_delete, "legacy_delete": legacy_time}
+        results.append(result)
+        print(f"{n:>7} artworks: add {result['add']:.4f} s, lookup {result['lookup']:.4f} s, "
+              f"delete {n // 2 + n % 2} {result['delete']:.4f} s (legacy {legacy_time:.2f} s)")
+    return results
+
+
+class LegacyArtwork():
+    """An artwork as a plain object with a __dict__, the way Artwork stored its data before."""
+
+    def __init__(self, artist, artwork_name, id_number, year, url = "no url entered", iiif_id = None):
+        self.artist = artist
+        self.artwork_name = artwork_name
+        self.id_number = id_number
+        self.year = year
+        self.url = url
+        self.iiif_id = iiif_id
+
+
+def artist_sizes(per_artist = None):
+    """
+    Yields the number of artworks of one artist after another: per_artist each, or with per_artist = None a
+    long tail as in the SMK collection, where a few artists have thousands of artworks and most have one to
+    five (artist k has max(2000 // k, 1 + k % 5)).
+    """
+    k = 0
+    while True:
+        k += 1
+        yield per_artist if per_artist is not None else max(2000 // k, 1 + k % 5)
+
+
+def smk_rows(n, per_artist = None):
+    """
+    Yields n (artist, frontend_url, id, production_date, iiif_id) tuples shaped like the SMKentries rows, with
+    the artworks per artist given by artist_sizes(per_artist).
+    """
+    sizes = artist_sizes(per_artist)
+    artist, left = -1, 0
+    for i in range(n):
+        if left == 0:
+            artist, left = artist + 1, next(sizes)
+        left -= 1
+        id = f"KMS{i}"
+        yield (f"Artist {artist}, Benchmark", f"https://open.smk.dk/artwork/image/{id}", id,
+               str(1800 + i % 200), f"https://iip.smk.dk/iiif/jp2/{id.lower()}_{i % 97:02d}.tif.jp2")
+
+
+def bench_memory(sizes = (10000, 100000), per_artist = None):
+    """
+    Measures the memory allocated for n artworks (per_artist artworks per artist, by default the long tail
+    of artist_sizes), held as LegacyArtwork objects in a dictionary per artist and as Artwork views in the
+    ArtworkCollection of an Artist, all artists sharing one store as in the catalog, for each n in sizes.
+    Returns a list of dictionaries with the bytes allocated.
+    """
+    results = []
+    for n in sizes:
+        tracemalloc.start()
+        legacy = {}
+        for artist_name, url, id, year, iiif_id in smk_rows(n, per_artist):
+            artworks = legacy.setdefault(artist_name, {})
+            artworks[len(artworks)] = LegacyArtwork(artist_name, f"{artist_name} - Artwork {len(artworks) + 1}",
+                                                    id, year, url, iiif_id)
+        legacy_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del legacy
+
+        tracemalloc.start()
+        artists = {}
+        store = ArtworkStore()
+        for artist_name, url, id, year, iiif_id in smk_rows(n, per_artist):
+            artist = artists.get(artist_name)
+            if artist is None:
+                artist = artists[artist_name] = Artist(artist_name, store = store)
+            count = len(artist.artworks_dictionary) + 1
+            artist.add_artworks([Artwork(artist, f"{artist_name} - Artwork {count}", id, year, url, iiif_id)])
+        columnar_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        artist_count = len(artists)
+        del artists, store
+
+        result = {"artworks": n, "artists": artist_count, "legacy_bytes": legacy_bytes,
+                  "columnar_bytes": columnar_bytes}
+        results.append(result)
+        print(f"{n:>7} artworks of {artist_count} artists: plain objects {legacy_bytes / 2 ** 20:.1f} MiB, "
+              f"columnar {columnar_bytes / 2 ** 20:.1f} MiB ({columnar_bytes / legacy_bytes:.0%})")
+    return results
+
+
+class NullCursor():
+    """A stand-in for a PyMySQL cursor that accepts every statement, counts the rows sent and returns no rows."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def execute(self, query, args = None):
+        self.rows += 1
+        return 0
+
+    def executemany(self, query, args):
+        self.rows += len(args)
+        return len(args)
+
+    def fetchall(self):
+        return ()
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class NullConnection():
+    """A stand-in for a PyMySQL connection, to measure the loader without a database."""
+
+    def cursor(self, cursor_class = None):
+        return NullCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class NullPool():
+    """A stand-in for the ConnectionPool of SMKpool.py that hands out NullConnection objects."""
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield NullConnection()
+
+    def close(self):
+        pass
+
+
+def measure(function):
+    """
+    Calls function with its output discarded and returns a tuple (result, seconds, peak bytes): the return
+    value, the wall time and the peak memory allocated while it ran.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_stages(sizes = (2000, 20000, 200000), config = None, output = "SMKbench.json"):
+    """
+    Runs harvest, transform, load, the pipelined harvest and load and menu startup on a synthetic collection of n
+    artworks for each n in sizes. With config (MySQL settings, see module SMKpool.py) the artworks are loaded
+    into that database, which is emptied first (main never passes the configured database); otherwise into a
+    stand-in connection. Returns the results and saves them to output as JSON.
+    """
+    from JSONtoMySQL import bulk_load, clean_entry, read_entries, row_hash
+    from SMKAPItoJSONstr import APItoJSON, iter_pages
+    from SMKfakeapi import start_process
+    from SMKmigrations import migrate
+    from SMKpipeline import Pipeline
+    from SMKpool import ConnectionPool, create_database
+    from SMKsnapshot import Snapshot, SnapshotCatalog, jsonl_snapshot
+
+    pool = NullPool()
+    if config is not None:
+        create_database(config)
+        pool = ConnectionPool(**config)
+        with pool.connection() as connection:
+            migrate(connection)
+
+    results = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+               "target": f"mysql://{config['host']}/{config['db']}" if config else "stand-in", "scenarios": []}
+    for n in sizes:
+        stages = {}
+
+        def record(stage, count, seconds, peak):
+            stages[stage] = {"seconds": round(seconds, 4), "records": count,
+                             "records_per_second": round(count / seconds) if count and seconds else None,
+                             "peak_mib": round(peak / 2 ** 20, 2)}
+            print(f"{n:>7} artworks, {stage:<9}: {seconds:8.3f} s, {stages[stage]['records_per_second'] or '-':>8} "
+                  f"records/s, peak {stages[stage]['peak_mib']:8.2f} MiB")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "SMKselstr.jsonl")
+            process, url = start_process(n)
+            try:
+                count, seconds, peak = measure(lambda: APItoJSON(full = True, output = path, api_url = url,
+                                                                 raise_errors = True))
+            finally:
+                process.terminate()
+            record("harvest", count, seconds, peak)
+
+            def transform():
+                count = 0
+                for item in read_entries(path):
+                    row_hash(clean_entry(item))
+                    count += 1
+                return count
+            record("transform", *measure(transform))
+
+            def load():
+                with pool.connection() as connection:
+                    if config is not None:
+                        cursor = connection.cursor()
+                        cursor.execute("DELETE FROM SMKentries")
+                        connection.commit()
+                        cursor.close()
+                    return bulk_load(connection, read_entries(path),
+                                     reject_path = os.path.join(directory, "SMKrejects.jsonl"))[0]
+            record("load", *measure(load))
+
+            def pipeline():
+                if config is not None:
+                    with pool.connection() as connection:
+                        cursor = connection.cursor()
+                        cursor.execute("DELETE FROM SMKentries")
+                        connection.commit()
+                        cursor.close()
+                pages = iter_pages(full = True, api_url = url)
+                return Pipeline(pool, reject_path = os.path.join(directory, "SMKrejects.jsonl")).run(
+                    pages, os.path.join(directory, "SMKpipeline.jsonl"))[1]
+            process, url = start_process(n)
+            try:
+                record("pipeline", *measure(pipeline))
+            finally:
+                process.terminate()
+
+            def startup():
+                menu = Menu(User("benchmark"), pool, start = False,
+                            journal_path = os.path.join(directory, "SMKjournal.jsonl"))
+                if config is not None:
+                    menu.catalog.find("Heltoft, Ulrik")
+                    menu.catalog.index()
+                menu.journal.close()
+            record("menu", *measure(startup))
+
+            snapshot_path = os.path.join(directory, "SMKsnapshot.bin")
+            record("snapshot", *measure(lambda: jsonl_snapshot(path, snapshot_path)))
+
+            def snapshot_startup():
+                with Snapshot(snapshot_path) as snapshot:
+                    menu = Menu(User("benchmark"), None, start = False, catalog = SnapshotCatalog(snapshot))
+                    menu.catalog.find("Heltoft, Ulrik")
+            record("snapmenu", *measure(snapshot_startup))
+
+        results["scenarios"].append({"records": n, "stages": stages})
+
+    pool.close()
+    with open(output, "w") as fout:
+        json.dump(results, fout, indent = 1)
+    print(f"Results saved to {output}")
+    return results
+
+
+def compare_results(baseline, results, tolerance = 0.2):
+    """
+    Compares the stage timings of results with a baseline (both as saved by bench_stages) and returns a list
+    of (records, stage, ratio) tuples of the stages that took more than 1 + tolerance times as long.
+    """
+    before = {(scenario["records"], stage): timing["seconds"] for scenario in baseline["scenarios"]
+              for stage, timing in scenario["stages"].items()}
+    regressions = []
+    for scenario in results["scenarios"]:
+        for stage, timing in scenario["stages"].items():
+            seconds = before.get((scenario["records"], stage))
+            if not seconds:
+                continue
+            ratio = timing["seconds"] / seconds
+            flag = "REGRESSION" if ratio > 1 + tolerance else ""
+            print(f"{scenario['records']:>7} artworks, {stage:<9}: {ratio:6.2f} x baseline {flag}")
+            if flag:
+                regressions.append((scenario["records"], stage, round(ratio, 2)))
+    return regressions
+
+
+# modules only some paths of the program need; importing interface or SMKinteraction must not load them
+DEFERRED_MODULES = ("PIL", "requests", "pymysql", "webbrowser")
+
+
+def import_time(module, repeat = 5):
+    """
+    Imports module in a fresh interpreter with -X importtime, repeat times, and returns a tuple (seconds,
+    modules, slowest): the fastest cumulative import time, the names of all modules loaded by the import and
+    the (seconds, name) tuples of the ten modules with the longest own import time in that run.
+    """
+    best = None
+    directory = os.path.dirname(os.path.abspath(__file__))
+    code = f"import sys; before = set(sys.modules); import {module}; print(' '.join(set(sys.modules) - before))"
+    for i in range(repeat):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd = directory,
+                                   capture_output = True, text = True, check = True)
+        timings = {}
+        for line in completed.stderr.splitlines():
+            fields = line.split("|")
+            if line.startswith("import time:") and fields[0].split(":")[1].strip().isdigit():
+                own, cumulative, name = int(fields[0].split(":")[1]), int(fields[1]), fields[2].strip()
+                timings[name] = (own / 1e6, cumulative / 1e6)
+        seconds = timings[module][1]
+        if best is None or seconds < best[0]:
+            loaded = set(completed.stdout.split())
+            slowest = sorted(((own, name) for name, (own, cumulative) in timings.items() if name in loaded),
+                             reverse = True)[:10]
+            best = (seconds, loaded, slowest)
+    return best
+
+
+def bench_imports(modules = ("interface", "SMKinteraction"), budget_ms = 100):
+    """
+    Checks the startup cost of modules: each must import within budget_ms milliseconds (the fastest of five
+    runs of python -X importtime) without loading any of DEFERRED_MODULES. Returns a list of the problems
+    found, empty if all modules are within budget.
+    """
+    problems = []
+    for module in modules:
+        seconds, loaded, slowest = import_time(module)
+        deferred = sorted(name for name in DEFERRED_MODULES if name in loaded)
+        print(f"import {module}: {seconds * 1000:.1f} ms (budget {budget_ms} ms), {len(loaded)} modules loaded")
+        for own, name in slowest:
+            print(f"  {own * 1000:7.2f} ms  {name}")
+        if seconds * 1000 > budget_ms:
+            problems.append(f"import {module} took {seconds * 1000:.1f} ms, more than {budget_ms} ms")
+        if deferred:
+            problems.append(f"import {module} loads {', '.join(deferred)}, which should be imported on first use")
+    for problem in problems:
+        print("OVER BUDGET:", problem)
+    return problems
+
+
+def main(argv = None):
+    """Runs the benchmarks selected on the command line; returns 1 if a stage regressed against the baseline."""
+    parser = argparse.ArgumentParser(description = "Benchmarks of the SMK project.")
+    parser.add_argument("--stages", action = "store_true", help = "benchmark harvest, transform, load and menu")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = None)
+    parser.add_argument("--mysql", action = "store_true",
+                        help = "load into MySQL (settings from the environment or smk.ini, database SMK_BENCH_DB, "
+                        "default SMKbench, which is emptied)")
+    parser.add_argument("--output", default = "SMKbench.json")
+    parser.add_argument("--baseline", help = "results of an earlier run to compare with")
+    parser.add_argument("--imports", action = "store_true", help = "check the import time of interface.py")
+    parser.add_argument("--budget-ms", type = float, default = 100, help = "import time budget in milliseconds")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        return 1 if bench_imports(budget_ms = args.budget_ms) else 0
+
+    if not args.stages:
+        bench_artwork_collection(tuple(args.sizes or (1000, 10000)))
+        bench_memory()
+        return 0
+    config = None
+    if args.mysql:
+        from SMKpool import db_config
+        config = db_config(interactive = False)
+        bench_db = os.environ.get("SMK_BENCH_DB", BENCH_DATABASE)
+        if bench_db == config["db"]:
+            print(f"Refusing to benchmark in {bench_db}, the configured database: its SMKentries table would be "
+                  f"emptied. Set SMK_BENCH_DB to another database.")
+            return 2
+        config = dict(config, db = bench_db)
+    results = bench_stages(tuple(args.sizes or (2000, 20000, 200000)), config, args.output)
+    if args.baseline:
+        with open(args.baseline) as fin:
+            if compare_results(json.load(fin), results):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+This module provides an on-disk cache for responses of the SMK API. Responses are stored under a key
+derived from the normalized query (url and sorted query parameters). Fresh responses (younger than the TTL)
+are served from disk; stale responses are revalidated with the ETag/Last-Modified headers of the stored
+response, so an unchanged response costs a 304 without a body. The cache is capped in size and evicts the
+least recently used responses. In cache-only mode the network is never used.
+
+The same cache stores the artwork images opened in the menu (ImageCache): an image is downloaded once, its
+file is written atomically so concurrent sessions never see half-written images, and stale images are
+revalidated with a conditional GET.
+
+Use module SMKAPItoJSONstr.py to pass a ResponseCache to APItoJSON(cache = ...)
+Use module SMKinteraction.py to get the path of a cached image with image_cache().path(url)
+
+Functions: image_cache()
+Classes: CacheMiss, ResponseCache, ImageCache
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+
+from SMKmetrics import metrics
+
+
+class CacheMiss(requests.exceptions.RequestException):
+    """Raised in cache-only mode when a response is not in the cache."""
+
+
+class ResponseCache():
+    """
+    A class representing an on-disk cache of HTTP responses.
+
+    Attributes:
+      directory : directory the responses are stored in
+      ttl       : seconds a stored response is served without revalidation
+      max_bytes : size of all stored response bodies above which responses are evicted
+      cache_only: if True, never use the network and raise CacheMiss for responses not in the cache
+
+    Methods:
+      __init__: Initializes a ResponseCache object
+      key     : Returns the cache key of a query
+      fetch   : Returns the path of the stored body of a query, fetching or revalidating it if needed
+      open    : Returns the stored body of a query as a binary file object
+      evict   : Removes least recently used responses until the cache fits max_bytes
+      clear   : Removes all stored responses
+    """
+
+    def __init__(self, directory = ".smk_cache", ttl = 24 * 3600, max_bytes = 1024 ** 3, cache_only = False):
+        """Initializes a ResponseCache object."""
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._size = None
+        os.makedirs(directory, exist_ok = True)
+
+
+    def key(self, url, params = None):
+        """Returns the cache key of a query; the order of the query parameters does not matter."""
+        query = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+        return hashlib.sha256(f"{url}?{query}".encode("utf-8")).hexdigest()
+
+
+    def _paths(self, key):
+        """Returns the paths of the body and the metadata of a cache key."""
+        base = os.path.join(self.directory, key)
+        return base + ".body", base + ".json"
+
+
+    def _read_meta(self, meta_path):
+        """Returns the stored metadata of a response or None."""
+        try:
+            with open(meta_path, "r") as fin:
+                return json.load(fin)
+        except (OSError, ValueError):
+            return None
+
+
+    def _write_atomic(self, path, chunks):
+        """Writes byte chunks to a temporary file next to path and moves it into place; returns the size."""
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir = self.directory, suffix = ".part")
+        try:
+            with os.fdopen(fd, "wb") as fout:
+                for chunk in chunks:
+                    fout.write(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return size
+
+
+    def fetch(self, session, url, params = None, timeout = 60):
+        """
+        Returns the path of the stored body of a query. A stored response younger than the TTL is returned
+        as is; an older one is revalidated with a conditional GET and only downloaded again if it changed.
+        """
+        key = self.key(url, params)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # one download per key at a time; a second caller waits and then finds the stored response
+        with key_lock:
+            return self._fetch(session, url, params, timeout, key)
+
+
+    def _fetch(self, session, url, params, timeout, key):
+        """Fetches a query for fetch while the lock of its key is held."""
+        body_path, meta_path = self._paths(key)
+        meta = self._read_meta(meta_path)
+        if meta is not None and not os.path.exists(body_path):
+            meta = None
+
+        cache = os.path.basename(os.path.normpath(self.directory))
+        if meta is not None and (self.cache_only or time.time() - meta["stored_at"] < self.ttl):
+            os.utime(body_path)
+            metrics().inc("smk_cache_requests_total", cache = cache, result = "fresh")
+            return body_path
+        if self.cache_only:
+            raise CacheMiss(f"Not in the cache (cache-only mode): {url}?{urlencode(params or {})}")
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with session.get(url, params = params, headers = headers, timeout = timeout, stream = True) as response:
+            if response.status_code == 304 and meta is not None:
+                meta["stored_at"] = time.time()
+                self._write_atomic(meta_path, [json.dumps(meta).encode("utf-8")])
+                os.utime(body_path)
+                metrics().inc("smk_cache_requests_total", cache = cache, result = "revalidated")
+                return body_path
+            response.raise_for_status()
+            size = self._write_atomic(body_path, response.iter_content(64 * 1024))
+            meta = {"url": url, "params": params, "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"), "stored_at": time.time(),
+                    "size": size}
+            self._write_atomic(meta_path, [json.dumps(meta).encode("utf-8")])
+        metrics().inc("smk_cache_requests_total", cache = cache, result = "downloaded")
+        metrics().inc("smk_cache_downloaded_bytes_total", size, cache = cache)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+        self.evict()
+        return body_path
+
+
+    def open(self, session, url, params = None, timeout = 60):
+        """Returns the stored body of a query as a binary file object (see fetch)."""
+        return open(self.fetch(session, url, params, timeout), "rb")
+
+
+    def evict(self):
+        """Removes least recently used responses until the size of all bodies fits max_bytes."""
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".body"):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, name[:-len(".body")]))
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, key in sorted(entries):
+                if self._size <= self.max_bytes:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                self._size -= size
+
+
+    def clear(self):
+        """Removes all stored responses."""
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith((".body", ".json", ".part")):
+                    os.unlink(os.path.join(self.directory, name))
+            self._size = 0
+
+
+class ImageCache(ResponseCache):
+    """
+    A class representing the on-disk cache of artwork images, a ResponseCache with its own directory and
+    requests session.
+
+    Methods:
+      __init__: Initializes an ImageCache object
+      path    : Returns the path of the cached image of a url, downloading it if needed
+    """
+
+    def __init__(self, directory = ".smk_images", ttl = 7 * 24 * 3600, max_bytes = 512 * 1024 ** 2,
+                 cache_only = False):
+        """Initializes an ImageCache object."""
+        super().__init__(directory, ttl, max_bytes, cache_only)
+        self.session = requests.Session()
+
+
+    def path(self, url, timeout = 60):
+        """Returns the path of the cached image of a url, downloading or revalidating it if needed."""
+        with metrics().timer("smk_image_fetch_seconds"):
+            return self.fetch(self.session, url, timeout = timeout)
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def image_cache():
+    """Returns the ImageCache shared by the whole program."""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
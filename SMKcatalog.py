@@ -0,0 +1,240 @@
+"""
+This module loads the artworks of any artist from the SMKentries table on demand, a page at a time.
+Pages are read with keyset pagination (WHERE id > last id ORDER BY id LIMIT page size) through an
+unbuffered server-side cursor, so no query ever holds more than one page. Hydrated artists are kept in a
+bounded LRU, so memory stays bounded however many artists are browsed; artists created in the menu are
+kept apart and never evicted. The artworks of all artists are rows of one shared columnar store (see module
+SMKcolumnar.py); once evicted artists leave more unused rows behind than the artists in memory use, their
+artworks are copied to a fresh store. Artist names that are not found as entered are looked up in a search index
+(see module SMKsearch.py) built from the distinct artists of the table on the first such search.
+
+Use module SMKinteraction.py to create a Catalog in Menu. SMKinteraction.py imports this module, so the
+Artist and Artwork classes are imported from it when they are first needed.
+
+Functions: display_name(db_name), db_names(name)
+Classes: Catalog
+"""
+from collections import OrderedDict
+
+from SMKcolumnar import ArtworkStore
+from SMKmetrics import metrics
+from SMKsearch import ArtistIndex
+
+
+# display names of the favorite artists and their names in the SMK data
+FAVORITES = {"Ulrik Heltoft": "Heltoft, Ulrik", "Ursula Christiansen": "Ursula Reuter Christiansen"}
+# rows of evicted artists the shared store may hold beyond twice the rows in use before it is compacted
+COMPACT_MIN_ROWS = 1000
+
+
+def display_name(db_name):
+    """
+    Returns the name an artist is shown with: 'Heltoft, Ulrik' becomes 'Ulrik Heltoft', and each of several
+    artists joined with '; ' is turned around on its own.
+    """
+    for name, favorite in FAVORITES.items():
+        if favorite == db_name:
+            return name
+    names = []
+    for part in db_name.split("; "):
+        last, comma, first = part.partition(", ")
+        names.append(f"{first} {last}" if comma and first else part)
+    return "; ".join(names)
+
+
+def db_names(name):
+    """Returns the names an artist entered by the user may have in the SMK data, most likely first."""
+    names = [name]
+    if name in FAVORITES:
+        names.insert(0, FAVORITES[name])
+    parts = []
+    for part in name.split("; "):
+        first, space, last = part.rpartition(" ")
+        parts.append(f"{last}, {first}" if space and first else part)
+    if "; ".join(parts) != name:
+        names.append("; ".join(parts))
+    return names
+
+
+class Catalog():
+    """
+    A class representing the artworks of the SMK database, loaded per artist on demand.
+
+    Attributes:
+        pool       : connection pool the artworks are read with (see module SMKpool.py)
+        page_size  : number of artworks loaded per page
+        max_artists: number of hydrated artists kept in memory
+        store      : columnar store shared by the artworks of all artists (see module SMKcolumnar.py)
+
+    Methods:
+        __init__    : Initializes a Catalog object
+        find        : Returns the Artist object of an artist name with its first page of artworks, or None
+        find_artwork: Returns the Artwork object of an artwork id with its artist, or None
+        load_page   : Loads the next page of artworks of an artist
+        has_more    : Returns whether an artist has artworks that are not loaded yet
+        add         : Adds an artist created in the menu to the catalog
+        index       : Returns the search index of all artist names, building it on the first call
+        suggest     : Returns the artist names most similar to a name
+    """
+
+    def __init__(self, pool, page_size = 50, max_artists = 32):
+        """Initializes a Catalog object."""
+        self.pool = pool
+        self.page_size = page_size
+        self.max_artists = max_artists
+        self.store = ArtworkStore()
+        self._artists = OrderedDict()
+        self._created = {}
+        self._index = None
+
+
+    def find(self, name):
+        """
+        Returns the Artist object of an artist name with its first page of artworks loaded, or None if the
+        artist has no artworks in the database.
+        """
+        from SMKinteraction import Artist
+
+        if name in self._created:
+            return self._created[name]
+        candidates = db_names(name)
+        if self._index is not None:
+            candidates = self._index.lookup(name) + candidates
+        for db_name in candidates:
+            if db_name in self._created:
+                return self._created[db_name]
+            if db_name in self._artists:
+                self._artists.move_to_end(db_name)
+                return self._artists[db_name]["artist"]
+
+            state = {"artist": Artist(display_name(db_name), db_name, self.store), "db_name": db_name,
+                     "last_id": "", "complete": False, "count": 0}
+            self._load(state)
+            if state["count"]:
+                self._artists[db_name] = state
+                if len(self._artists) > self.max_artists:
+                    self._artists.popitem(last = False)
+                    self._compact()
+                return state["artist"]
+        return None
+
+
+    def find_artwork(self, id):
+        """
+        Returns the Artwork object of an artwork id, or None if it is not in the database. Its artist is
+        found as by find and the pages of the artist's artworks are loaded up to the one holding it.
+        """
+        db_name = self._artist_of(id)
+        artist = self.find(db_name) if db_name is not None else None
+        if artist is None:
+            return None
+        seen = 0
+        while True:
+            for artwork in artist.artworks_dictionary.values()[seen:]:
+                if artwork.id_number == id:
+                    return artwork
+            seen = len(artist.artworks_dictionary)
+            if not self.load_page(artist):
+                return None
+
+
+    def _artist_of(self, id):
+        """Returns the artist of an artwork id as stored in the database, or None."""
+        with self.pool.connection() as connection, metrics().timer("smk_db_query_seconds", query = "artwork_id"):
+            cursor = connection.cursor()
+            cursor.execute("SELECT artist FROM SMKentries WHERE id = %s", (id,))
+            row = cursor.fetchone()
+            cursor.close()
+        return row[0] if row is not None else None
+
+
+    def _compact(self):
+        """
+        Copies the artworks of the artists in memory to a new store once the rows of evicted artists and
+        deleted artworks outnumber them, so the shared store stays bounded like the LRU of artists.
+        """
+        artists = [state["artist"] for state in self._artists.values()] + list(self._created.values())
+        live = sum(len(artist.artworks_dictionary) for artist in artists)
+        if len(self.store) <= 2 * live + COMPACT_MIN_ROWS:
+            return
+        self.store = ArtworkStore()
+        for artist in artists:
+            artist.artworks_dictionary.move(self.store)
+            artist.store = self.store
+
+
+    def _state(self, artist):
+        """Returns the paging state of a hydrated artist or None."""
+        for state in self._artists.values():
+            if state["artist"] is artist:
+                return state
+        return None
+
+
+    def _load(self, state):
+        """Reads the next page of artworks of an artist with a server-side cursor and adds them to it."""
+        import pymysql
+        from SMKinteraction import Artwork
+
+        artist = state["artist"]
+        new_artworks = []
+        with self.pool.connection() as connection, metrics().timer("smk_db_query_seconds", query = "artist_page"):
+            cursor = connection.cursor(pymysql.cursors.SSCursor)
+            cursor.execute("""SELECT frontend_url, id, production_date, image_iiif_id FROM SMKentries 
+                           WHERE artist = %s AND id > %s ORDER BY id LIMIT %s""", 
+                           (state["db_name"], state["last_id"], self.page_size))
+            for url, id, production_date, iiif_id in cursor:
+                state["count"] += 1
+                artwork_name = f"{artist.name} - Artwork {state['count']}"
+                new_artworks.append(Artwork(artist, artwork_name, id, production_date, url, iiif_id))
+                state["last_id"] = id
+            cursor.close()
+        state["complete"] = len(new_artworks) < self.page_size
+        for artwork in new_artworks:
+            artist.add_artworks([artwork])
+        return len(new_artworks)
+
+
+    def load_page(self, artist):
+        """Loads the next page of artworks of an artist; returns the number of artworks loaded."""
+        state = self._state(artist)
+        if state is None or state["complete"]:
+            return 0
+        return self._load(state)
+
+
+    def has_more(self, artist):
+        """Returns whether an artist has artworks that are not loaded yet."""
+        state = self._state(artist)
+        return state is not None and not state["complete"]
+
+
+    def add(self, artist):
+        """Adds an artist created in the menu to the catalog and its search index."""
+        self._created[artist.name] = artist
+        if self._index is not None:
+            self._index.add(artist.name)
+
+
+    def index(self):
+        """Returns the search index of all artist names, reading them with a server-side cursor on the first call."""
+        if self._index is None:
+            import pymysql
+
+            timer = metrics().timer("smk_db_query_seconds", query = "artist_index")
+            with self.pool.connection() as connection, timer:
+                cursor = connection.cursor(pymysql.cursors.SSCursor)
+                cursor.execute("SELECT DISTINCT artist FROM SMKentries WHERE artist IS NOT NULL")
+                self._index = ArtistIndex(row[0] for row in cursor)
+                cursor.close()
+            for name in self._created:
+                self._index.add(name)
+        return self._index
+
+
+    def suggest(self, name, limit = 5):
+        """Returns up to limit (artist name, display name) tuples of the artists most similar to name."""
+        index = self.index()
+        with metrics().timer("smk_search_seconds"):
+            matches = index.search(name, limit)
+        return [(db_name, display_name(db_name)) for db_name, score in matches]
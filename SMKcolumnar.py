@@ -0,0 +1,183 @@
+"""
+This module stores the artworks of the catalog column by column instead of as one Python object with a
+__dict__ per artwork. Every attribute is a column: the artists are interned (each Artist object is stored
+once and the rows hold its number in an array), and the strings (names, ids, years, urls and IIIF
+identifiers) are packed as UTF-8 into one growing buffer per column with array-backed offsets. Urls share
+long prefixes ("https://open.smk.dk/artwork/image/"), so the url columns store each prefix once and only
+the last path segment per row.
+
+An Artwork (module SMKinteraction.py) is a view of two slots, its store and its row; reading or assigning
+an attribute reads or writes the columns. A changed string is appended to the buffer, so the few edits made
+in the menu leave a little unused space behind.
+
+Use module SMKbenchmark.py to compare the memory of the columnar store with plain artwork objects.
+
+Functions: column_property(column, doc)
+Classes: StringColumn, ArtworkStore
+"""
+from array import array
+
+
+class StringColumn():
+    """
+    A class representing a column of strings (or None) packed into one UTF-8 buffer.
+
+    Attributes:
+      prefixed: if True, the part of a string up to its last '/' is stored once in a prefix table
+
+    Methods:
+      __init__: Initializes an empty StringColumn object
+      append  : Appends a value and returns its row
+      get     : Returns the value of a row
+      set     : Changes the value of a row
+      nbytes  : Returns the number of bytes held by the buffer and arrays
+      __len__ : Returns the number of rows
+    """
+
+    __slots__ = ("prefixed", "_data", "_starts", "_lengths", "_prefix_codes", "_prefixes", "_prefix_table")
+
+    NONE = 0xFFFFFFFF
+
+    def __init__(self, prefixed = False):
+        """Initializes an empty StringColumn object."""
+        self.prefixed = prefixed
+        self._data = bytearray()
+        self._starts = array("I")
+        self._lengths = array("I")
+        self._prefix_codes = array("H")
+        self._prefixes = []
+        self._prefix_table = {}
+
+
+    def _pack(self, value):
+        """Writes a value to the buffer and returns its (start, length, prefix code)."""
+        if value is None:
+            return 0, self.NONE, 0
+        value = str(value)
+        code = 0
+        if self.prefixed:
+            prefix, slash, value = value.rpartition("/")
+            prefix += slash
+            code = self._prefix_table.get(prefix)
+            if code is None:
+                code = self._prefix_table[prefix] = len(self._prefixes)
+                self._prefixes.append(prefix)
+        encoded = value.encode("utf-8")
+        start = len(self._data)
+        self._data += encoded
+        return start, len(encoded), code
+
+
+    def append(self, value):
+        """Appends a value and returns its row."""
+        start, length, code = self._pack(value)
+        self._starts.append(start)
+        self._lengths.append(length)
+        if self.prefixed:
+            self._prefix_codes.append(code)
+        return len(self._starts) - 1
+
+
+    def get(self, row):
+        """Returns the value of a row."""
+        length = self._lengths[row]
+        if length == self.NONE:
+            return None
+        start = self._starts[row]
+        value = self._data[start:start + length].decode("utf-8")
+        if self.prefixed:
+            return self._prefixes[self._prefix_codes[row]] + value
+        return value
+
+
+    def set(self, row, value):
+        """Changes the value of a row; the new value is appended to the buffer."""
+        start, length, code = self._pack(value)
+        self._starts[row] = start
+        self._lengths[row] = length
+        if self.prefixed:
+            self._prefix_codes[row] = code
+
+
+    def nbytes(self):
+        """Returns the number of bytes held by the buffer, the arrays and the prefix table."""
+        arrays = (self._starts, self._lengths, self._prefix_codes)
+        return (len(self._data) + sum(len(a) * a.itemsize for a in arrays)
+                + sum(len(prefix) for prefix in self._prefixes))
+
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return len(self._starts)
+
+
+class ArtworkStore():
+    """
+    A class representing the columns of a set of artworks.
+
+    Attributes:
+      artist_codes: array of the number of the artist of every row
+      name, id, year, url, iiif_id: StringColumn objects of the artwork attributes
+
+    Methods:
+      __init__ : Initializes an empty ArtworkStore object
+      append   : Appends an artwork and returns its row
+      artist_of: Returns the Artist object of a row
+      nbytes   : Returns the number of bytes held by the columns
+      __len__  : Returns the number of rows
+    """
+
+    __slots__ = ("artist_codes", "name", "id", "year", "url", "iiif_id", "_artists", "_artist_table")
+
+    def __init__(self):
+        """Initializes an empty ArtworkStore object."""
+        self.artist_codes = array("I")
+        self.name = StringColumn()
+        self.id = StringColumn()
+        self.year = StringColumn()
+        self.url = StringColumn(prefixed = True)
+        self.iiif_id = StringColumn(prefixed = True)
+        self._artists = []
+        self._artist_table = {}
+
+
+    def append(self, artist, artwork_name, id_number, year, url, iiif_id):
+        """Appends an artwork and returns its row; the artist is stored once however many artworks it has."""
+        code = self._artist_table.get(id(artist))
+        if code is None:
+            code = self._artist_table[id(artist)] = len(self._artists)
+            self._artists.append(artist)
+        self.artist_codes.append(code)
+        self.name.append(artwork_name)
+        self.id.append(id_number)
+        self.year.append(year)
+        self.url.append(url)
+        return self.iiif_id.append(iiif_id)
+
+
+    def artist_of(self, row):
+        """Returns the Artist object of a row."""
+        return self._artists[self.artist_codes[row]]
+
+
+    def nbytes(self):
+        """Returns the number of bytes held by the columns (not counting the Artist objects)."""
+        columns = (self.name, self.id, self.year, self.url, self.iiif_id)
+        return (len(self.artist_codes) * self.artist_codes.itemsize + len(self._artists) * 8
+                + sum(column.nbytes() for column in columns))
+
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return len(self.artist_codes)
+
+
+def column_property(column, doc = None):
+    """Returns a property that reads and writes a column of the store of a view with _store and _row slots."""
+    def get(view):
+        return getattr(view._store, column).get(view._row)
+
+    def set(view, value):
+        getattr(view._store, column).set(view._row, value)
+
+    return property(get, set, doc = doc)
@@ -0,0 +1,139 @@
+"""
+This module applies image operations (contrast, brightness, sharpness, resize) to artwork images and
+provides editing sessions for the menu.
+
+A chain of operations is fused into a single pass: resizes are applied first (the smallest box wins), all
+contrast and brightness operations are combined into one lookup table applied with Image.point, and
+sharpness, which needs the neighbouring pixels, is applied last. Up to clipping between the steps this
+gives the result of PIL.ImageEnhance applied one operation at a time, in a fraction of the passes.
+
+An EditSession decodes an image once at reduced resolution (JPEG draft mode lets the decoder scale while
+decoding) and keeps it in memory, so previews of different values are instant; only the accepted
+operations are applied to the full resolution image.
+
+Use module SMKbatch.py to apply operations to many images, module SMKinteraction.py for editing sessions.
+
+Functions: parse_operations(text), grey_mean(image), fuse(operations, mean), apply_operations(image,
+operations, mean)
+Classes: EditSession
+"""
+from PIL import Image, ImageEnhance, ImageStat
+
+from SMKmetrics import metrics
+
+
+OPERATIONS = ["contrast", "brightness", "sharpness", "resize"]
+
+
+def parse_operations(text):
+    """
+    Returns a list of (operation, value) tuples from text such as "contrast=1.5,resize=512". Enhancement
+    values are factors (1.0 leaves the image unchanged); resize fits the image into a value x value box.
+    """
+    operations = []
+    for part in text.split(","):
+        name, equals, value = part.strip().partition("=")
+        if name not in OPERATIONS or not equals:
+            raise ValueError(f"Unknown operation '{part}'. Available operations are: {', '.join(OPERATIONS)}")
+        operations.append((name, int(value) if name == "resize" else float(value)))
+    return operations
+
+
+def grey_mean(image):
+    """Returns the mean grey value of an image, the value ImageEnhance.Contrast scales around."""
+    return int(ImageStat.Stat(image.convert("L")).mean[0] + 0.5)
+
+
+def fuse(operations, mean):
+    """
+    Fuses a list of operations into a tuple (box, scale, offset, sharpness): the box to resize into (None
+    for no resize), the factor and offset of the combined contrast and brightness operations
+    (value -> scale * value + offset) and the list of sharpness factors. mean is the mean grey value of the
+    image, which every contrast and brightness operation moves along with the pixel values.
+    """
+    box = None
+    scale, offset = 1.0, 0.0
+    sharpness = []
+    for name, value in operations:
+        if name == "resize":
+            box = value if box is None else min(box, value)
+        elif name == "brightness":
+            scale, offset, mean = scale * value, offset * value, mean * value
+        elif name == "contrast":
+            scale, offset = scale * value, offset * value + (1 - value) * mean
+        elif name == "sharpness":
+            sharpness.append(value)
+        else:
+            raise ValueError(f"Unknown operation '{name}'")
+    return box, scale, offset, sharpness
+
+
+def apply_operations(image, operations, mean = None):
+    """
+    Returns a copy of image with the operations applied in a single fused pass (see fuse). mean is the mean
+    grey value used for contrast; by default it is measured on the (resized) image.
+    """
+    box = min((value for name, value in operations if name == "resize"), default = None)
+    if box is not None:
+        image = image.copy()
+        image.thumbnail((box, box))
+    if mean is None and any(name == "contrast" for name, value in operations):
+        mean = grey_mean(image)
+    _, scale, offset, sharpness = fuse(operations, mean or 0)
+
+    if (scale, offset) != (1.0, 0.0):
+        table = [min(255, max(0, int(scale * value + offset + 0.5))) for value in range(256)]
+        image = image.point(table * len(image.getbands()))
+    elif box is None:
+        image = image.copy()
+    for factor in sharpness:
+        image = ImageEnhance.Sharpness(image).enhance(factor)
+    return image
+
+
+class EditSession():
+    """
+    A class representing the editing of one image: previews on a reduced resolution proxy kept in memory,
+    the accepted operations applied once to the full resolution image.
+
+    Attributes:
+      path : path of the image file
+      size : size of the full resolution image
+      proxy: the image decoded at reduced resolution (at most proxy_size pixels wide and high)
+      mean : mean grey value of the image, measured on the proxy
+
+    Methods:
+      __init__: Initializes an EditSession object and decodes the proxy
+      preview : Returns the proxy with operations applied
+      apply   : Returns the full resolution image with operations applied
+    """
+
+    def __init__(self, path, proxy_size = 1024):
+        """Initializes an EditSession object and decodes the proxy."""
+        self.path = path
+        with metrics().timer("smk_image_edit_seconds", step = "decode_proxy"), Image.open(path) as image:
+            self.size = image.size
+            # JPEG images are scaled down by the decoder; other formats are decoded in full
+            image.draft("RGB", (proxy_size, proxy_size))
+            proxy = image.convert("RGB")
+            proxy.thumbnail((proxy_size, proxy_size))
+        self.proxy = proxy
+        self.mean = grey_mean(proxy)
+        self._full = None
+
+
+    def preview(self, operations):
+        """Returns the proxy with operations applied; resize boxes are scaled to the proxy."""
+        ratio = self.proxy.width / self.size[0]
+        operations = [(name, max(1, int(value * ratio)) if name == "resize" else value) for name, value in operations]
+        with metrics().timer("smk_image_edit_seconds", step = "preview"):
+            return apply_operations(self.proxy, operations, self.mean)
+
+
+    def apply(self, operations):
+        """Returns the full resolution image with operations applied; the image is decoded on the first call."""
+        with metrics().timer("smk_image_edit_seconds", step = "apply"):
+            if self._full is None:
+                with Image.open(self.path) as image:
+                    self._full = image.convert("RGB")
+            return apply_operations(self._full, operations, self.mean)
@@ -0,0 +1,220 @@
+"""
+This module serves a synthetic art collection over HTTP in the shape of the SMK API search endpoint
+(api.smk.dk/api/v1/art/search), so the harvest can be measured and tested locally at any size and without
+the network. Pages are requested with the offset and rows query parameters and answered with the offset,
+rows and found fields followed by the items array. Every item is generated from its position, so the same
+collection size always gives the same data: several artworks per artist, some artworks by two artists,
+production dates as single years and periods (production_date[0]["period"]), and some artworks without a
+production date or an image. Responses carry an ETag (derived from the collection size) and a Last-Modified
+header and conditional requests are answered with 304 Not Modified, as the response cache (module
+SMKcache.py) expects.
+
+Run this module to serve a collection until interrupted, then point the harvest at it:
+python SMKfakeapi.py --records 20000 --port 8765
+SMK_API_URL=http://127.0.0.1:8765/api/v1/art/search/ python interface.py harvest --full --force
+
+Functions: synthetic_item(i), start_process(records, host), main()
+Classes: FakeSMKAPI
+"""
+import argparse
+import json
+import multiprocessing
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+FIRST_NAMES = ["Ulrik", "Ursula", "Vilhelm", "Anna", "Peder Severin", "Søren", "Hélène", "Asger", "Marie",
+               "Per"]
+LAST_NAMES = ["Heltoft", "Reuter Christiansen", "Hammershøi", "Ancher", "Krøyer", "Eckersberg", "Schjerfbeck",
+              "Jorn", "Købke", "Kirkeby"]
+ARTWORKS_PER_ARTIST = 40
+
+
+def synthetic_item(i):
+    """Returns the i-th artwork of the synthetic collection as a dictionary shaped like an SMK API item."""
+    artist_number = i // ARTWORKS_PER_ARTIST
+    last_name = f"{LAST_NAMES[artist_number % 10]}{artist_number // 100 or ''}"
+    artist = f"{last_name}, {FIRST_NAMES[artist_number // 10 % 10]}"
+    artists = [artist] if i % 17 else [artist, f"{LAST_NAMES[i % 10]}, {FIRST_NAMES[i % 7]}"]
+    id = f"KMS{i}" if i % 3 else f"KKSgb{i}/{i % 5}"
+    year = 1700 + i % 320
+    item = {"id": id, "object_number": id, "artist": artists,
+            "titles": [{"title": f"Artwork number {i}", "language": "en"}],
+            "frontend_url": f"https://open.smk.dk/artwork/image/{id}",
+            "production_date": [{"start": f"{year}-01-01T00:00:00.000Z",
+                                 "end": f"{year + i % 3}-12-31T00:00:00.000Z",
+                                 "period": f"{year}" if i % 3 == 0 else f"{year}-{year + i % 3}"}],
+            "techniques": ["Oil on canvas"],
+            "dimensions": [{"type": "height", "unit": "cm", "value": 40 + i % 60}],
+            "has_image": i % 5 != 0}
+    if i % 11 == 0:
+        item["production_date"] = []
+    if item["has_image"]:
+        item["image_iiif_id"] = f"https://iip.smk.dk/iiif/jp2/{id.lower().replace('/', '_')}.tif.jp2"
+    return item
+
+
+class FakeSMKAPI():
+    """
+    A class representing a local HTTP server answering SMK API search requests from a synthetic collection.
+
+    Attributes:
+      records      : size of the synthetic collection
+      host         : address the server listens on
+      port         : port the server listens on (0 picks a free port)
+      url          : url of the search endpoint, to pass as api_url to APItoJSON (see module SMKAPItoJSONstr.py)
+      etags        : whether responses carry an ETag (False leaves Last-Modified as the only validator)
+      last_modified: value of the Last-Modified header of every response
+      served       : list of (offset, rows, status) tuples of the requests answered
+
+    Methods:
+      __init__     : Initializes a FakeSMKAPI object
+      start        : Starts serving in a background thread and returns the url of the search endpoint
+      stop         : Stops the server
+      page         : Returns the body of the response to an offset/rows request
+      etag         : Returns the ETag of the responses
+      not_modified : Returns whether a conditional request can be answered with 304 Not Modified
+      __enter__, __exit__: start and stop the server in a with statement
+    """
+
+    def __init__(self, records = 2000, host = "127.0.0.1", port = 0):
+        """Initializes a FakeSMKAPI object."""
+        self.records = records
+        self.host = host
+        self.port = port
+        self.url = None
+        self.etags = True
+        self.last_modified = formatdate(usegmt = True)
+        self.served = []
+        self._server = None
+        self._thread = None
+
+
+    def etag(self):
+        """Returns the ETag of the responses, which changes with the size of the collection."""
+        return f'"smk-{self.records}"'
+
+
+    def not_modified(self, headers):
+        """Returns whether a request with headers is conditional and its response has not changed."""
+        if headers.get("If-None-Match") is not None:
+            return self.etags and headers["If-None-Match"] == self.etag()
+        return headers.get("If-Modified-Since") == self.last_modified
+
+
+    def page(self, offset, rows):
+        """Returns the body of the response to an offset/rows request as bytes."""
+        items = ",".join(json.dumps(synthetic_item(i), ensure_ascii = False)
+                         for i in range(offset, min(offset + rows, self.records)))
+        return (f'{{"offset":{offset},"rows":{rows},"found":{self.records},"items":[{items}],"facets":{{}}}}'
+                .encode("utf-8"))
+
+
+    def start(self):
+        """Starts serving in a background thread and returns the url of the search endpoint."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.rstrip("/") != "/api/v1/art/search":
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query)
+                try:
+                    offset = int(query.get("offset", ["0"])[0])
+                    rows = int(query.get("rows", ["10"])[0])
+                except ValueError:
+                    self.send_error(400)
+                    return
+                if api.not_modified(self.headers):
+                    api.served.append((offset, rows, 304))
+                    self.send_response(304)
+                    self.send_validators()
+                    self.end_headers()
+                    return
+                body = api.page(offset, rows)
+                api.served.append((offset, rows, 200))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_validators()
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_validators(self):
+                if api.etags:
+                    self.send_header("ETag", api.etag())
+                self.send_header("Last-Modified", api.last_modified)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.url = f"http://{self.host}:{self.port}/api/v1/art/search/"
+        self._thread = threading.Thread(target = self._server.serve_forever, name = "fake-smk-api",
+                                        daemon = True)
+        self._thread.start()
+        return self.url
+
+
+    def stop(self):
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _serve(records, host, connection):
+    """Serves a synthetic collection in a child process and sends the url of its endpoint to the parent."""
+    api = FakeSMKAPI(records, host)
+    connection.send(api.start())
+    api._thread.join()
+
+
+def start_process(records, host = "127.0.0.1"):
+    """
+    Serves a synthetic collection of records artworks from a child process, so generating the responses
+    does not compete with the measured harvest for the interpreter. Returns a tuple (process, url); stop the
+    server with process.terminate().
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target = _serve, args = (records, host, child), daemon = True)
+    process.start()
+    return process, parent.recv()
+
+
+def main():
+    """Serves a synthetic collection of the size given on the command line until interrupted."""
+    parser = argparse.ArgumentParser(description = "Serve a synthetic SMK API collection.")
+    parser.add_argument("--records", type = int, default = 20000)
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    args = parser.parse_args()
+    api = FakeSMKAPI(args.records, args.host, args.port)
+    print(f"Serving {args.records} artworks at {api.start()} (Ctrl-C to stop)")
+    try:
+        api._thread.join()
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+This module builds image urls for artworks from their IIIF image identifier (the image_iiif_id the SMK API
+returns for every artwork with an image, stored in the SMKentries table). The SMK image server implements
+the IIIF Image API, so an image can be requested in exactly the region and size that is needed:
+
+  {identifier}/{region}/{size}/{rotation}/{quality}.{format}
+
+Listings use small thumbnails, the menu works on a screen sized rendition and the full resolution is only
+downloaded on demand.
+
+Functions: iiif_url(iiif_id, region, size, rotation, quality, fmt), thumbnail_url(iiif_id, width),
+display_url(iiif_id, box), full_url(iiif_id)
+"""
+
+THUMBNAIL_WIDTH = 200
+DISPLAY_BOX = 1024
+
+
+def iiif_url(iiif_id, region = "full", size = "max", rotation = 0, quality = "default", fmt = "jpg"):
+    """
+    Returns the IIIF Image API url of an image. region is "full", "square" or "x,y,w,h"; size is "max",
+    "w," (width), ",h" (height) or "!w,h" (fit into a w x h box keeping the aspect ratio).
+    """
+    return f"{iiif_id.rstrip('/')}/{region}/{size}/{rotation}/{quality}.{fmt}"
+
+
+def thumbnail_url(iiif_id, width = THUMBNAIL_WIDTH):
+    """Returns the url of a thumbnail of an image that is width pixels wide."""
+    return iiif_url(iiif_id, size = f"{width},")
+
+
+def display_url(iiif_id, box = DISPLAY_BOX):
+    """Returns the url of a rendition of an image that fits into a box x box square."""
+    return iiif_url(iiif_id, size = f"!{box},{box}")
+
+
+def full_url(iiif_id):
+    """Returns the url of an image in full resolution."""
+    return iiif_url(iiif_id)
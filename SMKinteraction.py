@@ -1,23 +1,187 @@
 """ 
 This module interacts with the MySQL database containing information on artworks of the National Gallery 
-of Denmark (SMK) to retrieve data of two artists. It gives the user options to change artwork entries, 
+of Denmark (SMK) to retrieve data of any artist on demand. It gives the user options to change artwork entries, 
 and view and manipulate images of their artworks based on user input.
   
 Use module SMKAPItoJSONstr.py to get the data from the SMK API 
 Use module JSONtoMySQL.py to store SMK JSON data in MySQL database
 Use module interface.py to import this module, SMKAPItoJSONstr.py and JSONtoMySQL.py
 
-Classes: Artist, Artwork, User, Menu 
+The modules needed only on some paths of the menu are imported when they are first used, so the menu comes 
+up quickly: PIL (module SMKediting.py) when an image is manipulated, requests (module SMKprefetch.py) when 
+the artworks of an artist are listed, webbrowser when an image is viewed and pymysql (module SMKjournal.py) 
+when the menu opens on a database.
+
+Classes: ArtworkCollection, Artist, Artwork, User, Menu 
 """ 
 
 import sys
-import webbrowser
-import pymysql
+from array import array
 import re
-import requests
-import urllib.request 
-from PIL import Image, ImageEnhance
-import os
+from SMKcatalog import Catalog
+from SMKcolumnar import ArtworkStore, column_property
+from SMKimages import display_url, full_url
+
+
+# artists whose artworks the user may delete in the menu; the artworks of all other artists are kept
+DELETABLE_ARTISTS = ("Ursula Christiansen",)
+
+
+class ArtworkCollection():
+  """ 
+  A class representing the artworks of an artist. Every artwork gets an index number (handle) that stays 
+  the same when other artworks are deleted; artworks are kept in the order they were added and can be 
+  found by handle or by name in constant time. The collection holds the row of every artwork in the store 
+  of the artist (see module SMKcolumnar.py) and returns a view of the row when an artwork is accessed; the 
+  name index is built on the first lookup by name.
+
+  Methods: 
+    __init__   : Initializes an empty ArtworkCollection object
+    add        : Adds an artwork and returns its handle
+    delete     : Deletes the artwork with a handle and returns it
+    delete_name: Deletes the first artwork with a name and returns it
+    rename     : Updates the name index when an artwork is renamed
+    handle_of  : Returns the handle of the first artwork with a name
+    move       : Copies the artworks to another store and keeps their rows there
+    keys, values, items, __getitem__, __contains__, __len__, __iter__: as for a dictionary of handles
+  """
+
+  __slots__ = ("_store", "_rows", "_names", "_count")
+
+  DELETED = 0xFFFFFFFF
+
+  def __init__(self):
+    """Initializes an empty ArtworkCollection object."""
+    self._store = None
+    self._rows = array("I")
+    self._names = None
+    self._count = 0
+
+
+  def add(self, artwork):
+    """Adds an artwork and returns its handle; all artworks of a collection must share one store."""
+    if self._store is None:
+      self._store = artwork._store
+    elif artwork._store is not self._store:
+      raise ValueError(f"{artwork.artwork_name} is stored with the artworks of another artist")
+    handle = len(self._rows)
+    self._rows.append(artwork._row)
+    if self._names is not None:
+      self._index(artwork.artwork_name, handle)
+    self._count += 1
+    return handle
+
+
+  def _index(self, artwork_name, handle):
+    """Adds a handle to the name index; a name maps to a handle, or to a list of handles if it is shared."""
+    handles = self._names.get(artwork_name)
+    if handles is None:
+      self._names[artwork_name] = handle
+    elif isinstance(handles, int):
+      self._names[artwork_name] = [handles, handle]
+    else:
+      handles.append(handle)
+
+
+  def _unindex(self, artwork_name, handle):
+    """Removes a handle from the name index."""
+    if self._names is None:
+      return
+    handles = self._names[artwork_name]
+    if isinstance(handles, int):
+      del self._names[artwork_name]
+    else:
+      handles.remove(handle)
+      if len(handles) == 1:
+        self._names[artwork_name] = handles[0]
+
+
+  def _handles(self, artwork_name):
+    """Returns the list of handles of the artworks with a name, building the name index on the first call."""
+    if self._names is None:
+      self._names = {}
+      for handle, row in enumerate(self._rows):
+        if row != self.DELETED:
+          self._index(self._store.name.get(row), handle)
+    handles = self._names.get(artwork_name, [])
+    return [handles] if isinstance(handles, int) else handles
+
+
+  def delete(self, handle):
+    """Deletes the artwork with a handle and returns it; raises KeyError if there is none."""
+    artwork = self[handle]
+    self._unindex(artwork.artwork_name, handle)
+    self._rows[handle] = self.DELETED
+    self._count -= 1
+    return artwork
+
+
+  def delete_name(self, artwork_name):
+    """Deletes the first artwork with a name and returns it; raises KeyError if there is none."""
+    return self.delete(self.handle_of(artwork_name))
+
+
+  def rename(self, artwork, new_name):
+    """Updates the name index for an artwork of the collection that is renamed to new_name."""
+    for handle in self._handles(artwork.artwork_name):
+      if self._rows[handle] == artwork._row:
+        self._unindex(artwork.artwork_name, handle)
+        self._index(new_name, handle)
+        return
+
+
+  def handle_of(self, artwork_name):
+    """Returns the handle of the first artwork with a name; raises KeyError if there is none."""
+    handles = self._handles(artwork_name)
+    if not handles:
+      raise KeyError(artwork_name)
+    return handles[0]
+
+
+  def move(self, store):
+    """
+    Copies the artworks to another store and keeps their rows there, e.g. when the catalog compacts its
+    store; returns the number of artworks copied. Views of the old rows made before stay on the old store.
+    """
+    old = self._store
+    if old is not None:
+      for handle, row in enumerate(self._rows):
+        if row != self.DELETED:
+          self._rows[handle] = store.append(old.artist_of(row), old.name.get(row), old.id.get(row),
+                                            old.year.get(row), old.url.get(row), old.iiif_id.get(row))
+    self._store = store
+    return self._count
+
+
+  def keys(self):
+    return [handle for handle, row in enumerate(self._rows) if row != self.DELETED]
+
+
+  def values(self):
+    return [Artwork.view(self._store, row) for row in self._rows if row != self.DELETED]
+
+
+  def items(self):
+    return [(handle, Artwork.view(self._store, row)) for handle, row in enumerate(self._rows)
+            if row != self.DELETED]
+
+
+  def __getitem__(self, handle):
+    if handle not in self:
+      raise KeyError(handle)
+    return Artwork.view(self._store, self._rows[handle])
+
+
+  def __contains__(self, handle):
+    return (isinstance(handle, int) and 0 <= handle < len(self._rows) and self._rows[handle] != self.DELETED)
+
+
+  def __len__(self):
+    return self._count
+
+
+  def __iter__(self):
+    return iter(self.keys())
 
 
 class Artist():
@@ -26,7 +190,10 @@ class Artist():
 
   Attributes:
     name: name of artist
-    artworks_dictionary: stores all artworks of an artist with Menu __init__
+    db_name: name of artist in the SMKentries table, e.g. 'Heltoft, Ulrik' for 'Ulrik Heltoft'
+    artworks_dictionary: stores all artworks of an artist as an ArtworkCollection
+    store: columnar store holding the data of the artworks (see module SMKcolumnar.py), shared by all 
+           artists of a catalog; a store of its own if none is given
 
   Methods: 
     __init__        : Initializes an Artist object and its artworks
@@ -35,34 +202,39 @@ class Artist():
     display artworks: Prints all artworks of the artist to the user
   """
 
-  def __init__(self, name):
+  __slots__ = ("name", "db_name", "artworks_dictionary", "store")
+
+  def __init__(self, name, db_name = None, store = None):
     """Initializes an Artist object and its artworks."""
     self.name = name
-    self.artworks_dictionary = {}
+    self.db_name = db_name or name
+    self.store = store if store is not None else ArtworkStore()
+    self.artworks_dictionary = ArtworkCollection()
 
 
   def add_artworks(self, new_artworkslist):
     """Adds new artwork to list of artworks."""
-    for i in range(len(new_artworkslist)):
-      self.artworks_dictionary[len(self.artworks_dictionary) + i] = new_artworkslist[i]
+    for artwork in new_artworkslist:
+      self.artworks_dictionary.add(artwork)
       
         
-  def delete_artwork(self, artwork_name):  
-    """Deletes artwork of the artist from list of artworks."""
+  def delete_artwork(self, artwork_name, display = True):  
+    """
+    Deletes artwork of the artist from list of artworks. The index numbers of the other artworks do not 
+    change. With display = False the remaining artworks are not printed (for deleting many artworks).
+    Returns the deleted Artwork object or None.
+    """
     print(f"You have deleted the artwork entry: {artwork_name}")
     
-    for key in self.artworks_dictionary:
-      if self.artworks_dictionary[key].artwork_name == artwork_name:
-          del self.artworks_dictionary[key]
-          break
-    
-    newvalue_list = list(self.artworks_dictionary.values())
-
-    self.artworks_dictionary = {}
-    for i in range(len(newvalue_list)):
-        self.artworks_dictionary[i] = newvalue_list[i]
+    deleted = None
+    try:
+      deleted = self.artworks_dictionary.delete_name(artwork_name)
+    except KeyError:
+      print(f"{self.name} has no artwork named {artwork_name}")
 
-    self.display_artworks()
+    if display:
+      self.display_artworks()
+    return deleted
 
 
   def display_artworks(self):
@@ -74,7 +246,8 @@ class Artist():
 
 class Artwork():
   """ 
-  A class representing an artwork. 
+  A class representing an artwork: a view of a row of the columnar store of its artist (see module 
+  SMKcolumnar.py), so an artwork holds no data of its own.
 
   Attributes:
     artist: name of artist
@@ -82,28 +255,64 @@ class Artwork():
     id_number: id_number unique for each artwork
     year: year of production
     url: url for image of artwork
+    iiif_id: IIIF image identifier the image urls are built from (see module SMKimages.py), None if the 
+             artwork has no image
 
   Methods: 
     __init__        : Initializes an Artwork object
+    view            : Returns the Artwork object of an existing row of a store
     update_entry    : Updates data of an attribute of an artwork 
     delete_entry    : Calls delete_artwork from artist that this artwork belongs to
     display         : Prints artwork attribute data to the user
     view_image      : Opens the url for the image of the artwork in a browser
-    manipulate_entry: Downloads the image of an artwork, opens the original image, changes the contrast 
+    manipulate_entry: Downloads the screen sized or full resolution image of an artwork into the image 
+                      cache (see module SMKcache.py), opens the original image, changes the contrast 
                       value based on user input and opens the modified image
   """
 
-  def __init__(self, artist, artwork_name, id_number, year, url = "no url entered"):
-    """Initializes an Artwork object."""
-    self.artist = artist
-    self.artwork_name = artwork_name
-    self.id_number = id_number
-    self.year = year
-    self.url = url 
+  __slots__ = ("_store", "_row")
+
+  artwork_name = column_property("name")
+  id_number = column_property("id")
+  year = column_property("year")
+  url = column_property("url")
+  iiif_id = column_property("iiif_id")
+
+  def __init__(self, artist, artwork_name, id_number, year, url = "no url entered", iiif_id = None):
+    """Initializes an Artwork object as a new row of the store of its artist."""
+    self._store = artist.store
+    self._row = artist.store.append(artist, artwork_name, id_number, year, url, iiif_id)
+
+
+  @classmethod
+  def view(cls, store, row):
+    """Returns the Artwork object of an existing row of a store."""
+    artwork = cls.__new__(cls)
+    artwork._store = store
+    artwork._row = row
+    return artwork
+
+
+  def __eq__(self, other):
+    """Artworks are equal if they are views of the same row."""
+    return isinstance(other, Artwork) and self._store is other._store and self._row == other._row
+
+
+  def __hash__(self):
+    return hash((id(self._store), self._row))
+
+
+  @property
+  def artist(self):
+    """Returns the Artist object of the artwork."""
+    return self._store.artist_of(self._row)
 
 
   def update_entry(self): 
-    """Updates data of an attribute of an artwork."""
+    """
+    Updates data of an attribute of an artwork. Returns a tuple (attribute, previous value) for the journal
+    (see module SMKjournal.py); for the artist the previous value is its name in the database.
+    """
     print()
     print(f"The artwork you want to update is '{self.artwork_name}'")
     
@@ -145,23 +354,30 @@ class Artwork():
     update_info = validate_update(choice)
 
     if choice == "artist":
+        previous = self.artist.db_name
         self.artist.name = update_info
+        self.artist.db_name = update_info
     if choice == "artwork_name":
+        previous = self.artwork_name
+        self.artist.artworks_dictionary.rename(self, update_info)
         self.artwork_name = update_info
     if choice == "id_number":
+        previous = self.id_number
         self.id_number = update_info
     if choice == "year":
+        previous = self.year
         self.year = update_info
     
     print(                               
       f"Artwork information has been updated to: Artist = {self.artist.name}, \n"
       f" artwork = {self.artwork_name}, ID = {self.id_number}, year = {self.year}"
       )
+    return choice, previous
     
 
   def delete_entry(self):
-    """Calls delete_artwork from artist that this artwork belongs to."""
-    self.artist.delete_artwork(self.artwork_name) 
+    """Calls delete_artwork from artist that this artwork belongs to; returns the deleted artwork or None."""
+    return self.artist.delete_artwork(self.artwork_name) 
 
 
   def display(self):
@@ -175,38 +391,38 @@ class Artwork():
 
   def view_image(self):
     """Opens the url for the image of the artwork in a browser."""
+    import webbrowser
     webbrowser.open(self.url)
 
 
   def manipulate_entry(self):  
     """
-    Downloads the image of an artwork, opens the original image, changes the contrast value based
-    on user input and opens the modified image. 
+    Downloads the image of an artwork, opens the original image, previews contrast values entered by
+    the user on a reduced resolution copy and opens the modified image once a value is accepted.
     """
-    dl_urldict = {
-        "Ursula Christiansen - Artwork 1": "https://iip-thumb.smk.dk/iiif/jp2/0k225f76j_kms8918.tif.jp2/full/!1024,/0/default.jpg",
-         "Ursula Christiansen - Artwork 2": "https://iip-thumb.smk.dk/iiif/jp2/jd4731021_kms8920.tif.jp2/full/!1024,/0/default.jpg", 
-         "Ursula Christiansen - Artwork 3": "https://open.smk.dk/artwork/image/kms8919",
-         "Ulrik Heltoft - Artwork 1": "https://iip-thumb.smk.dk/iiif/jp2/4x51hp371_kks2019_96.tif.jp2/full/!1024,/0/default.jpg"}
-    
+    from SMKediting import EditSession
+    from SMKprefetch import prefetcher
+
     print(self.artwork_name)
     
-    dl_url = dl_urldict.get(self.artwork_name)
-    
-    if dl_url == None:    
-      print(f'Sorry, this method is not available for the image you selected. Available images are: {dl_urldict.keys()}')
+    if not self.iiif_id:    
+      print("Sorry, there is no image available for the artwork you selected.")
     else:
+      size = input("Please enter 'full' to work on the image in full resolution or press enter for the "
+                   "screen sized image: ")
+      dl_url = full_url(self.iiif_id) if size.strip().lower() == "full" else display_url(self.iiif_id)
       print("The image that will open now is the orginal image.")
     
       try:
-        urllib.request.urlretrieve(dl_url, 
-        "SMKimage.jpg")
-        print("The image was downloaded into: ", os.getcwd())
+        image_path = prefetcher().path(dl_url)
+        print("The image is cached in: ", image_path)
       except Exception as e:
         print("An error occurred retrieving the image.", e)
+        return
         
-      image = Image.open("SMKimage.jpg")
-      image.show()
+      # the image is decoded once at reduced resolution; previews of other values are made from memory
+      session = EditSession(image_path)
+      session.proxy.show()
 
     
 
@@ -228,10 +444,14 @@ class Artwork():
             else:
                 print("Please enter a number using decimals only.")
       
-      contr_user = contrast()
+      while True:
+        contr_user = contrast()
+        print("The image that will now open is a preview of the modified image.")
+        session.preview([("contrast", contr_user)]).show()
+        if input("Enter 'y' to apply this contrast value or press enter to try another value: ").strip().lower() == "y":
+          break
 
-      mod_contr = ImageEnhance.Contrast(image)
-      newimage = mod_contr.enhance(contr_user)
+      newimage = session.apply([("contrast", contr_user)])
       print("The image that will now open is the modified image.")
       newimage.show()
     
@@ -266,63 +486,40 @@ class Menu():
 
   Attributes:
     user: user as defined in User class 
+    pool: shared connection pool (see module SMKpool.py), None to browse without a database
+    catalog: loads the artworks of an artist on demand (see module SMKcatalog.py)
+    journal: saves the edits of artworks to the database in the background (see module SMKjournal.py), None
+             without a database
     current_artwork: artwork selected by the user
 
   Methods: 
-    __init__         : Defining an Artist and Artwork object and options for the user
+    __init__         : Defining the catalog and options for the user
     edit_artwork_menu: Calls an Artwork method to view or make changes to artwork
     search_by_artist : Lets user select artist and artwork, displays artworks of the selected 
                        artist and calls edit_artwork_menu method
+    choose_suggestion: Lets user select one of the artists with names similar to the search input
     main_menu        : Lets the user select main menu options by calling search_by_artist or create_artwork 
                        method
     create_artwork   : Creates a new artwork entry, adds artwork to list and displays current artworks
                        to user 
   
   """
-  def __init__(self, user, connection):
-      """Defining an Artist and Artwork object and options for the user."""
-      
-      cursor = connection.cursor()
- 
-      cursor.execute("SELECT frontend_url, id, production_date FROM SMKentries WHERE \
-                     artist = 'Heltoft, Ulrik'")
-      HU_artwork = cursor.fetchall()
-      u_heltoft_artworklist = [] 
-      u_heltoft = Artist("Ulrik Heltoft") 
-      index = 0 
-
-      for entry in HU_artwork:
-        index += 1
-        url = entry[0]  
-        artwork_name = "Ulrik Heltoft - Artwork " + str(index)
-        id = entry[1]
-        production_date = entry[2]
-        new_artwork = Artwork(u_heltoft, artwork_name, id, production_date, url) 
-        u_heltoft_artworklist.append(new_artwork)
-        u_heltoft.add_artworks([new_artwork])
-
-
-      cursor.execute("SELECT frontend_url, id, production_date FROM SMKentries WHERE \
-                     artist = 'Ursula Reuter Christiansen'")
-      URC_artwork = cursor.fetchall()
-      christiansen_artworklist = [] 
-      u_christiansen = Artist("Ursula Christiansen") 
-      index = 0 
-
-      for entry in URC_artwork:
-        index += 1
-        url = entry[0]   
-        artwork_name = "Ursula Christiansen - Artwork " + str(index)
-        id = entry[1]
-        production_date = entry[2]
-        new_artwork = Artwork(u_christiansen, artwork_name, id, production_date, url) 
-        christiansen_artworklist.append(new_artwork)
-        u_christiansen.add_artworks([new_artwork])
-
-      self.artworks = {u_heltoft: u_heltoft_artworklist, u_christiansen: christiansen_artworklist}
-      self.artistlist = [u_heltoft, u_christiansen]
-
-      cursor.close()  
+  def __init__(self, user, pool, start = True, journal_path = "SMKjournal.jsonl", catalog = None):
+      """
+      Defining the catalog and options for the user and, unless start = False (e.g. for benchmarks), 
+      opening the main menu. The artworks of an artist are read from the catalog
+      (see module SMKcatalog.py) when the user searches for the artist, a page at a time, with connections
+      checked out of the shared pool (see module SMKpool.py). Edits are recorded in the journal (see
+      module SMKjournal.py), which writes them to the database every few seconds and at exit.
+      With pool = None and a read-only catalog, e.g. a SnapshotCatalog (see module SMKsnapshot.py), the 
+      menu runs without a database and edits are not saved.
+      """
+      self.pool = pool
+      self.catalog = catalog if catalog is not None else Catalog(pool)
+      self.journal = None
+      if pool is not None:
+        from SMKjournal import Journal
+        self.journal = Journal(pool, journal_path)
 
       self.user = user
       self.edit_options = {
@@ -337,7 +534,8 @@ class Menu():
       2: "create new artwork entry",
       3: "exit program",
       } 
-      self.main_menu()
+      if start:
+        self.main_menu()
 
       
 
@@ -354,16 +552,18 @@ class Menu():
         print()
         choice = int(input("Please select an option and enter the number: "))
         if choice == 1:
-            current_artwork.update_entry()
+            change = current_artwork.update_entry()
+            if self.journal is not None:
+                self.journal.updated(current_artwork, *change)
         
         elif choice == 2:
             print(f"Do you want to delete the selected artwork: {current_artwork.artwork_name}") 
             del_choice = input("Please enter 'yes' or 'no': ").capitalize()
             if del_choice == "Yes":
-                if "Ulrik" in current_artwork.artwork_name:
+                if current_artwork.artist.name not in DELETABLE_ARTISTS:
                     print("You don't have permission to delete this artwork.")
-                if "Ursula" in current_artwork.artwork_name:
-                    current_artwork.delete_entry()           
+                elif current_artwork.delete_entry() is not None and self.journal is not None:
+                    self.journal.deleted(current_artwork)
             elif del_choice == "No":
                 print("The artwork has not been deleted.")
             else:
@@ -389,7 +589,7 @@ class Menu():
   def search_by_artist(self):
     """
     Lets user select artist and artwork, displays artworks of the selected artist and calls
-    edit_artwork_menu method.
+    edit_artwork_menu method. An artwork ID (e.g. KMS1) entered instead of a name opens that artwork.
     """
     print()
     print(
@@ -399,22 +599,40 @@ class Menu():
     print(*self.user.favorite_artists, sep = " & ")
     print()
     search_input = input(
-        "Which artist\'s works would you like to view? Please enter name: "
+        "Which artist\'s works would you like to view? Please enter name or artwork ID: "
             )
 
-    artwork_artists = self.artworks.keys() 
-    found_match = False
-
-    for artist in artwork_artists:           
-      if search_input == artist.name:
-        found_match = True
+    artist = self.catalog.find(search_input)
+    if artist is None:
+      current_artwork = self.catalog.find_artwork(search_input.strip())
+      if current_artwork is not None:
+        current_artwork.display()
+        self.edit_artwork_menu(current_artwork)
+        return
+      artist = self.choose_suggestion(search_input)
+
+    if artist is not None:
+        from SMKprefetch import prefetcher
         artist.display_artworks()  
+        # the user usually opens one of the listed artworks next; download their images meanwhile
+        prefetcher().prefetch_artworks(artist.artworks_dictionary.values())
         
         try:
-            input_index = int(      
-            input(
-            'Please enter artwork index number to view artwork and access the "Edit Artwork Menu": '
-            ))
+            while True:
+                prompt = 'Please enter artwork index number to view artwork and access the "Edit Artwork Menu"'
+                if self.catalog.has_more(artist):
+                    prompt += ' or "n" to load more artworks'
+                choice = input(prompt + ": ")
+                if choice.strip().lower() == "n" and self.catalog.has_more(artist):
+                    listed = len(artist.artworks_dictionary)
+                    self.catalog.load_page(artist)
+                    artist.display_artworks()
+                    # the page just loaded first, so it gets the renditions before the earlier pages
+                    artworks = artist.artworks_dictionary.values()
+                    prefetcher().prefetch_artworks(artworks[listed:] + artworks[:listed])
+                    continue
+                break
+            input_index = int(choice)
             current_artwork = artist.artworks_dictionary[input_index]
             current_artwork.display()    
 
@@ -424,14 +642,32 @@ class Menu():
             print("Something went wrong. Please enter a valid number.")  
         except KeyError:                     
             print("The index you entered does not exist. Please enter the correct index.") 
+        finally:
+            # the listed artworks are left behind; drop the downloads that have not started
+            prefetcher().cancel()
 
-
-    
-    if found_match == False:
+    else:
       print(
         "Sorry, the artist you entered is not in the database. You are being directed to the main menu."
       )    
 
+  def choose_suggestion(self, search_input):
+    """
+    Lets user select one of the artists whose names are most similar to search_input; returns the selected
+    Artist object or None.
+    """
+    suggestions = self.catalog.suggest(search_input)
+    if not suggestions:
+      return None
+    print("Did you mean one of these artists?")
+    for i, (db_name, name) in enumerate(suggestions, 1):
+      print(f"{i}: {name}")
+    choice = input("Please enter the number of the artist or press enter to go back: ")
+    if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+      return self.catalog.find(suggestions[int(choice) - 1][0])
+    return None
+
+
   def main_menu(self):
     """Lets the user select main menu options by calling search_by_artist or create_artwork method."""
     while (True):
@@ -454,6 +690,11 @@ class Menu():
 
         elif choice == 3:
             print("goodbye")
+            if "SMKprefetch" in sys.modules:
+                # stop the downloads of the prefetcher, if the menu ever started it
+                sys.modules["SMKprefetch"].prefetcher().shutdown()
+            if self.journal is not None:
+                self.journal.close()
             sys.exit(0)
 
         else:
@@ -478,17 +719,10 @@ class Menu():
         elif artist_input.isalpha() == False:
           print("Please enter valid name using letters only")
 
-    is_match = False
-    matched_artist = ""
-    for artistobject in self.artistlist:
-      if artist_input == artistobject.name:
-        matched_artist = artistobject
-        is_match = True
-        break
-        
-    if is_match == False:
-      matched_artist = Artist(artist_input)
-      self.artistlist.append(matched_artist)
+    matched_artist = self.catalog.find(artist_input)
+    if matched_artist is None:
+      matched_artist = Artist(artist_input, store = self.catalog.store)
+      self.catalog.add(matched_artist)
 
     while True:
         artwork_name = input("Please enter name of artwork: ")   
@@ -516,8 +750,9 @@ class Menu():
             break
 
     created_artwork = [Artwork(matched_artist, artwork_name, id_number, year_production)]
-    self.artworks[matched_artist] = created_artwork 
     matched_artist.add_artworks(created_artwork)
+    if self.journal is not None:
+      self.journal.created(created_artwork[0])
     print("New entry has been created")
     matched_artist.display_artworks()  
 
@@ -0,0 +1,264 @@
+"""
+This module makes the edits of the menu (updated, deleted and created artworks) durable in the SMKentries
+table without a database round trip per edit. Every edit is appended to a local journal file (and synced to
+disk) at once; the edits are written to the database behind the user's back, every few seconds and at
+exit, in one transaction per flush. Before a flush the edits are coalesced per artwork: an artwork edited
+three times is written once, an artwork created and deleted again is not written at all.
+
+After a crash the edits that were not flushed are replayed from the journal when the next Journal is
+created. A flush is recorded in the journal after its transaction committed; a flush that is replayed
+because the program stopped in between writes the same rows again, which does no harm.
+
+Artwork names are not stored in the database (they are numbered when an artist is loaded), so renaming an
+artwork is not journaled.
+
+Use module SMKinteraction.py to create a Journal in Menu.
+
+Functions: artwork_row(artwork), coalesce(records)
+Classes: Journal
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+
+from JSONtoMySQL import UPSERT_SQL, row_hash
+from SMKmetrics import metrics
+
+
+COLUMNS = ("artist", "frontend_url", "id", "production_date", "image_iiif_id")
+
+
+def artwork_row(artwork):
+    """Returns the SMKentries columns of an Artwork object as a dictionary."""
+    return {"artist": artwork.artist.db_name,
+            "frontend_url": None if artwork.url == "no url entered" else artwork.url,
+            "id": artwork.id_number,
+            "production_date": artwork.year,
+            "image_iiif_id": artwork.iiif_id}
+
+
+def coalesce(records):
+    """
+    Coalesces journal records into the statements of one flush: returns a tuple (renames, deletes, upserts)
+    of the (old, new) artist renames in order, the ids of the rows to delete and the rows to insert or
+    update. Rows are tracked by their current id and remember the id they have in the database (origin,
+    None for created artworks), so an artwork whose id changed replaces its old row.
+    """
+    renames = []
+    entries = {}
+    for record in records:
+        op = record["op"]
+        if op == "rename_artist":
+            renames.append((record["old"], record["new"]))
+            for origin, row in entries.values():
+                if row is not None and row["artist"] == record["old"]:
+                    row["artist"] = record["new"]
+        elif op == "create":
+            row = dict(record["row"])
+            entry = entries.get(row["id"])
+            entries[row["id"]] = (entry[0] if entry else None, row)
+        elif op == "update":
+            origin, _ = entries.pop(record["id"], (record["id"], None))
+            row = dict(record["row"])
+            entries[row["id"]] = (origin, row)
+        elif op == "delete":
+            origin, _ = entries.pop(record["id"], (record["id"], None))
+            if origin is not None:
+                entries[record["id"]] = (origin, None)
+    deletes = [origin for origin, row in entries.values()
+               if origin is not None and (row is None or row["id"] != origin)]
+    upserts = [row for origin, row in entries.values() if row is not None]
+    return renames, deletes, upserts
+
+
+class Journal():
+    """
+    A class representing the write-behind journal of the edits made in the menu.
+
+    Attributes:
+      pool      : connection pool the edits are written with (see module SMKpool.py)
+      path      : path of the append-only journal file
+      interval  : seconds between flushes
+      batch_size: number of rows sent per executemany call
+
+    Methods:
+      __init__: Initializes a Journal object, replays unflushed edits and starts flushing in the background
+      created : Records a created artwork
+      updated : Records an updated attribute of an artwork
+      deleted : Records a deleted artwork
+      pending : Returns the number of edits not flushed yet
+      flush   : Writes the pending edits to the database in one transaction
+      close   : Stops the background flushing and flushes the pending edits
+    """
+
+    def __init__(self, pool, path = "SMKjournal.jsonl", interval = 5.0, batch_size = 500):
+        """Initializes a Journal object, replays unflushed edits and starts flushing in the background."""
+        self.pool = pool
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._failing = False
+        self._closed = False
+
+        self._records = self._replay()
+        self._seq = self._records[-1]["seq"] if self._records else 0
+        self._compact()
+        self._log = open(path, "a", encoding = "utf8")
+        if self._records:
+            print(f"Replaying {len(self._records)} unsaved edits from {path}")
+            self._flush_in_background()
+
+        self._thread = threading.Thread(target = self._run, name = "journal", daemon = True)
+        self._thread.start()
+        atexit.register(self.close)
+
+
+    def _replay(self):
+        """Returns the records of the journal file that were not flushed, ignoring a torn last line."""
+        records = []
+        try:
+            with open(self.path, "r", encoding = "utf8") as fin:
+                for line in fin:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the program stopped while writing this record; nothing after it was written
+                        break
+                    if record["op"] == "flushed":
+                        records = [r for r in records if r["seq"] > record["seq"]]
+                    else:
+                        records.append(record)
+        except FileNotFoundError:
+            pass
+        return records
+
+
+    def _compact(self):
+        """Rewrites the journal file with the pending records only, replacing it atomically."""
+        fd, temp_path = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(self.path)), suffix = ".part")
+        try:
+            with open(fd, "w", encoding = "utf8") as fout:
+                for record in self._records:
+                    fout.write(json.dumps(record) + "\n")
+                fout.flush()
+                os.fsync(fout.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+    def _append(self, record):
+        """Appends a record to the journal file and syncs it to disk; the lock must be held."""
+        self._log.write(json.dumps(record) + "\n")
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+
+    def _record(self, record):
+        """Numbers a record, appends it to the journal file and adds it to the pending records."""
+        with self._lock:
+            self._seq += 1
+            record["seq"] = self._seq
+            self._append(record)
+            self._records.append(record)
+
+
+    def created(self, artwork):
+        """Records a created artwork."""
+        self._record({"op": "create", "row": artwork_row(artwork)})
+
+
+    def updated(self, artwork, attribute, previous):
+        """
+        Records that an attribute of an artwork was changed from previous to its current value. Changing
+        the artist renames the artist of all its artworks.
+        """
+        if attribute == "artist":
+            self._record({"op": "rename_artist", "old": previous, "new": artwork.artist.db_name})
+        elif attribute == "id_number":
+            self._record({"op": "update", "id": previous, "row": artwork_row(artwork)})
+        elif attribute == "year":
+            self._record({"op": "update", "id": artwork.id_number, "row": artwork_row(artwork)})
+
+
+    def deleted(self, artwork):
+        """Records a deleted artwork."""
+        self._record({"op": "delete", "id": artwork.id_number})
+
+
+    def pending(self):
+        """Returns the number of edits not flushed yet."""
+        with self._lock:
+            return len(self._records)
+
+
+    def flush(self):
+        """
+        Writes the pending edits to the database in one transaction and returns the number of rows written.
+        The edits stay pending if the transaction fails.
+        """
+        with self._flush_lock:
+            with self._lock:
+                records = list(self._records)
+            if not records:
+                return 0
+            renames, deletes, upserts = coalesce(records)
+            with self.pool.connection() as connection, metrics().timer("smk_journal_flush_seconds"):
+                cursor = connection.cursor()
+                for old, new in renames:
+                    cursor.execute("UPDATE SMKentries SET artist = %s WHERE artist = %s", (new, old))
+                for i in range(0, len(deletes), self.batch_size):
+                    cursor.executemany("DELETE FROM SMKentries WHERE id = %s", deletes[i:i + self.batch_size])
+                for i in range(0, len(upserts), self.batch_size):
+                    rows = [tuple(row[column] for column in COLUMNS) for row in upserts[i:i + self.batch_size]]
+                    cursor.executemany(UPSERT_SQL, [row + (row_hash(row),) for row in rows])
+                connection.commit()
+                cursor.close()
+
+            metrics().inc("smk_journal_rows_written_total", len(deletes) + len(upserts))
+            last = records[-1]["seq"]
+            with self._lock:
+                self._records = [record for record in self._records if record["seq"] > last]
+                if self._records:
+                    self._append({"op": "flushed", "seq": last})
+                else:
+                    self._log.seek(0)
+                    self._log.truncate()
+            return len(deletes) + len(upserts)
+
+
+    def _flush_in_background(self):
+        """Flushes the pending edits, reporting the first of a series of failures instead of raising it."""
+        try:
+            self.flush()
+            self._failing = False
+        except Exception as e:
+            if not self._failing:
+                print(f"\nYour edits could not be saved to the database yet ({e}); they are kept in {self.path}.")
+            self._failing = True
+
+
+    def _run(self):
+        """Flushes the pending edits every interval seconds until the journal is closed."""
+        while not self._stop.wait(self.interval):
+            self._flush_in_background()
+
+
+    def close(self):
+        """Stops the background flushing and flushes the pending edits; edits that fail stay in the journal."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Your edits could not be saved to the database ({e}); they will be saved on the next start.")
+        self._log.close()
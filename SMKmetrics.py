@@ -0,0 +1,193 @@
+"""
+This module collects counters, gauges and timings from every stage of the project: HTTP requests to the SMK
+API (latency, bytes), the transform of artworks into table rows, the load (batch latency, rows per second),
+the queries of the menu and the download and editing of images. Metrics are kept in memory and exported in
+two ways:
+
+1. a structured log: every timing is appended as one JSON object per line, and a summary of all metrics
+is appended at exit (set SMK_METRICS_LOG or configure(log_path = ...))
+2. a Prometheus textfile: all metrics in the Prometheus text format, written at exit for the node exporter
+textfile collector (set SMK_METRICS_TEXTFILE or configure(textfile = ...))
+
+Metric names follow the Prometheus conventions: smk_<what>_<unit>, with _total for counters. A timing is
+exported as a summary (_count and _sum) and its maximum (_max).
+
+Use metrics().timer(name, **labels) around a block, metrics().inc(name, value, **labels) to count and
+metrics().set(name, value, **labels) for gauges.
+
+Functions: escape(label), metrics()
+Classes: Metrics
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def escape(label):
+    """Returns a label value escaped for the Prometheus text format."""
+    return str(label).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics():
+    """
+    A class representing the metrics of a run.
+
+    Attributes:
+      log_path: path of the structured JSON log, or None
+      textfile: path of the Prometheus textfile, or None
+
+    Methods:
+      __init__        : Initializes a Metrics object
+      configure       : Sets the log path and the textfile path
+      inc             : Adds to a counter
+      set             : Sets a gauge
+      observe         : Records a timing in seconds and logs it
+      timer           : Context manager that times a block with observe
+      snapshot        : Returns all metrics as a dictionary
+      write_prometheus: Writes all metrics to a Prometheus textfile
+      close           : Writes the textfile and the summary to the log
+    """
+
+    def __init__(self, log_path = None, textfile = None):
+        """Initializes a Metrics object."""
+        self.log_path = None
+        self.textfile = None
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._log = None
+        self.configure(log_path, textfile)
+
+
+    def configure(self, log_path = None, textfile = None):
+        """Sets the log path and the textfile path; None leaves a setting unchanged."""
+        with self._lock:
+            if log_path is not None and log_path != self.log_path:
+                if self._log is not None:
+                    self._log.close()
+                self.log_path = log_path
+                self._log = open(log_path, "a", encoding = "utf8")
+            if textfile is not None:
+                self.textfile = textfile
+
+
+    def inc(self, name, value = 1, **labels):
+        """Adds value to the counter name with labels."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+
+    def set(self, name, value, **labels):
+        """Sets the gauge name with labels to value."""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+    def observe(self, name, seconds, **labels):
+        """Records a timing of name with labels and appends it to the log."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                self._timings[key] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+            if self._log is not None:
+                event = {"ts": round(time.time(), 3), "metric": name, "seconds": round(seconds, 6), **labels}
+                self._log.write(json.dumps(event, ensure_ascii = False) + "\n")
+
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the block of a with statement and records it with observe, also if the block raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+    def snapshot(self):
+        """Returns all metrics as a dictionary of lists of {"name", "labels", ...} dictionaries."""
+        with self._lock:
+            return {"counters": [{"name": name, "labels": dict(labels), "value": value}
+                                 for (name, labels), value in sorted(self._counters.items())],
+                    "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                               for (name, labels), value in sorted(self._gauges.items())],
+                    "timings": [{"name": name, "labels": dict(labels), "count": count, "sum": round(total, 6),
+                                 "max": round(maximum, 6)}
+                                for (name, labels), (count, total, maximum) in sorted(self._timings.items())]}
+
+
+    def write_prometheus(self, path = None):
+        """Writes all metrics to a Prometheus textfile (path or the configured textfile), replacing it atomically."""
+        path = path or self.textfile
+        if path is None:
+            return
+
+        def series(name, labels, value):
+            label_text = ",".join(f'{key}="{escape(label)}"' for key, label in labels.items())
+            return f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}"
+
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for kind, entries in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            for entry in entries:
+                if entry["name"] not in typed:
+                    typed.add(entry["name"])
+                    lines.append(f"# TYPE {entry['name']} {kind}")
+                lines.append(series(entry["name"], entry["labels"], entry["value"]))
+        for entry in snapshot["timings"]:
+            name = entry["name"]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} summary")
+            lines.append(series(name + "_count", entry["labels"], entry["count"]))
+            lines.append(series(name + "_sum", entry["labels"], entry["sum"]))
+        for entry in snapshot["timings"]:
+            name = entry["name"] + "_max"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(series(name, entry["labels"], entry["max"]))
+
+        temp_path = path + ".part"
+        with open(temp_path, "w", encoding = "utf8") as fout:
+            fout.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+
+    def close(self):
+        """Writes the Prometheus textfile and appends a summary of all metrics to the log."""
+        self.write_prometheus()
+        with self._lock:
+            log, self._log = self._log, None
+        if log is not None:
+            log.write(json.dumps({"ts": round(time.time(), 3), "summary": self.snapshot()},
+                                 ensure_ascii = False) + "\n")
+            log.close()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def metrics():
+    """
+    Returns the Metrics object shared by the whole program, created on the first call with the log and
+    textfile paths of the environment (SMK_METRICS_LOG, SMK_METRICS_TEXTFILE) and closed at exit.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(os.environ.get("SMK_METRICS_LOG"), os.environ.get("SMK_METRICS_TEXTFILE"))
+            atexit.register(_metrics.close)
+        return _metrics
@@ -0,0 +1,123 @@
+"""
+This module evolves the schema of the SMK database in place. Every migration has a version number and is
+applied once; the applied versions are recorded in the SMKschema_version table. MySQL commits DDL
+statements implicitly, so a migration is recorded right after it has run and an interrupted migrate()
+continues with the first migration that was not recorded.
+
+It also checks with EXPLAIN that the queries the application runs most often (artworks by artist and by id)
+are answered with an index instead of a full table scan.
+
+Use module JSONtoMySQL.py to call migrate(connection) before loading artworks.
+
+Functions: applied_versions(cursor), migrate(connection), check_indexes(connection)
+"""
+
+
+def create_entries(cursor):
+    """Creates the SMKentries table as originally defined."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS SMKentries (entry INT AUTO_INCREMENT PRIMARY KEY,
+    artist VARCHAR(100), frontend_url VARCHAR(2048), id VARCHAR(50), production_date VARCHAR(20))""")
+
+
+def unique_ids(cursor):
+    """
+    Removes duplicate copies of an id left by appending loads (keeping the last one loaded) and adds the
+    content_hash column and a unique key on id used for upserts.
+    """
+    cursor.execute("SHOW COLUMNS FROM SMKentries LIKE 'content_hash'")
+    if cursor.fetchone() is None:
+        cursor.execute("""DELETE older FROM SMKentries older JOIN SMKentries newer
+                       ON older.id = newer.id AND older.entry < newer.entry""")
+        cursor.execute("ALTER TABLE SMKentries ADD COLUMN content_hash CHAR(40), ADD UNIQUE KEY (id)")
+
+
+def artist_index(cursor):
+    """
+    Sizes the columns for the whole collection (long and multiple artist names, date ranges such as
+    '1890-1891') and adds an index on artist.
+    """
+    cursor.execute("""ALTER TABLE SMKentries MODIFY artist VARCHAR(255), MODIFY id VARCHAR(64),
+                   MODIFY production_date VARCHAR(64), ADD INDEX artist_idx (artist)""")
+
+
+def artist_paging_index(cursor):
+    """Replaces the artist index by an (artist, id) index that also serves the paging order of SMKcatalog.py."""
+    cursor.execute("ALTER TABLE SMKentries DROP INDEX artist_idx, ADD INDEX artist_id_idx (artist, id)")
+
+
+def iiif_column(cursor):
+    """Adds the IIIF image identifier of an artwork, used to build image urls (see module SMKimages.py)."""
+    cursor.execute("ALTER TABLE SMKentries ADD COLUMN image_iiif_id VARCHAR(255)")
+
+
+def null_missing(cursor):
+    """
+    Replaces the string 'None' written for missing artists, production dates and images by NULL; the content
+    hash of a row stays valid since it hashes NULL as 'None'.
+    """
+    for column in ("artist", "production_date", "image_iiif_id"):
+        cursor.execute(f"UPDATE SMKentries SET {column} = NULL WHERE {column} IN ('None', '')")
+
+
+MIGRATIONS = [
+    (1, "create SMKentries", create_entries),
+    (2, "unique id and content hash", unique_ids),
+    (3, "column sizes and artist index", artist_index),
+    (4, "artist and id index for paging", artist_paging_index),
+    (5, "IIIF image identifier", iiif_column),
+    (6, "NULL for missing values", null_missing),
+]
+
+HOT_QUERIES = [
+    ("artworks by artist", """SELECT frontend_url, id, production_date FROM SMKentries
+     WHERE artist = %s AND id > %s ORDER BY id LIMIT 50""", ("Heltoft, Ulrik", "")),
+    ("artwork by id", "SELECT artist, frontend_url, production_date FROM SMKentries WHERE id = %s",
+     ("KMS1",)),
+]
+
+
+def applied_versions(cursor):
+    """Returns the set of migration versions applied to the database."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS SMKschema_version (version INT PRIMARY KEY,
+                   description VARCHAR(255), applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    cursor.execute("SELECT version FROM SMKschema_version")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(connection):
+    """Applies the migrations not yet applied to the database in version order; returns the versions applied."""
+    cursor = connection.cursor()
+    done = applied_versions(cursor)
+    applied = []
+    for version, description, migration in MIGRATIONS:
+        if version in done:
+            continue
+        print(f"Applying schema migration {version}: {description}")
+        migration(cursor)
+        cursor.execute("INSERT INTO SMKschema_version (version, description) VALUES (%s, %s)",
+                       (version, description))
+        connection.commit()
+        applied.append(version)
+    cursor.close()
+    return applied
+
+
+def check_indexes(connection):
+    """
+    Runs EXPLAIN on the hot queries and returns a list of (query name, index used, ok) tuples; ok is False if
+    a query scans the whole table.
+    """
+    import pymysql
+
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    results = []
+    for name, query, args in HOT_QUERIES:
+        cursor.execute("EXPLAIN " + query, args)
+        plan = cursor.fetchone()
+        # a unique key lookup of an id that is not in the table is answered from the index at plan time
+        ok = (plan["key"] is not None and plan["type"] in ("const", "eq_ref", "ref", "range")
+              or "no matching row in const table" in (plan.get("Extra") or ""))
+        results.append((name, plan["key"], ok))
+        print(f"{name}: {'uses index ' + str(plan['key']) if ok else 'FULL TABLE SCAN'} ({plan['type']})")
+    cursor.close()
+    return results
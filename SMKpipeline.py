@@ -0,0 +1,289 @@
+"""
+This module refreshes the SMK database in one pipelined pass instead of a harvest followed by a load, so the
+network and the database are busy at the same time and a refresh takes about as long as the slower of the
+two instead of their sum:
+
+  pages of the SMK API -> [pages queue] -> transform workers -> [batches queue] -> loader connections
+
+The pages are fetched concurrently (see iter_pages in module SMKAPItoJSONstr.py) and written to the harvest
+file as before; transform workers turn the artworks into table rows (clean_entry and row_hash of module
+JSONtoMySQL.py) and collect them in batches, and several loaders upsert the batches, each on its own
+connection of the pool. Both queues are bounded: when the database falls behind, the queues fill up and the
+harvest waits (backpressure), so memory stays bounded however large the collection is. The first error in
+any stage stops all of them; the pages and batches still queued are dropped and the error is raised once
+every thread has ended.
+
+Rows whose content hash is unchanged are skipped and rows that fail are written to a reject file, as in
+bulk_load. The time every stage spent waiting for a full queue (the next stage is slower) or an empty queue
+(the previous stage is slower) is recorded in the metrics (module SMKmetrics.py).
+
+Run python interface.py refresh to harvest and load the whole collection this way.
+
+Functions: harvest_and_load(full, max_workers, transform_workers, loaders, batch_size, queue_size, output,
+config, cache, api_url, raise_errors)
+Classes: Pipeline
+"""
+import codecs
+import json
+import queue
+import threading
+import time
+
+from JSONtoMySQL import BATCH_SIZE, REJECT_FILE, changed_rows, clean_entry, row_hash, upsert_batch
+from SMKAPItoJSONstr import API_URL, MAX_WORKERS, OUTPUT_FILE, iter_pages
+from SMKmetrics import metrics
+
+
+TRANSFORM_WORKERS = 2
+LOADERS = 3
+QUEUE_SIZE = 8
+
+DONE = object()
+
+
+class Pipeline():
+    """
+    A class representing a pipelined load of harvested pages into the SMKentries table.
+
+    Attributes:
+      pool             : connection pool the loaders draw their connections from (see module SMKpool.py)
+      transform_workers: number of threads turning artworks into table rows
+      loaders          : number of threads upserting batches, each on its own connection
+      batch_size       : number of rows upserted per executemany call
+      queue_size       : maximum number of pages and of batches waiting between two stages
+      reject_path      : path of the file the rows that failed to load are written to
+
+    Methods:
+      __init__: Initializes a Pipeline object
+      run     : Loads an iterable of pages and returns the number of harvested, loaded, skipped and
+                rejected rows
+      stop    : Stops all stages, e.g. after an error
+    """
+
+    def __init__(self, pool, transform_workers = TRANSFORM_WORKERS, loaders = LOADERS, batch_size = BATCH_SIZE,
+                 queue_size = QUEUE_SIZE, reject_path = REJECT_FILE):
+        """Initializes a Pipeline object."""
+        self.pool = pool
+        self.transform_workers = transform_workers
+        self.loaders = loaders
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.reject_path = reject_path
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._counts = {"harvested": 0, "loaded": 0, "skipped": 0, "rejected": 0}
+
+
+    def stop(self, error = None):
+        """Stops all stages; the first error passed is raised by run."""
+        with self._lock:
+            if error is not None and self._error is None:
+                self._error = error
+        self._stop.set()
+
+
+    def _count(self, key, value):
+        """Adds value to one of the row counts."""
+        with self._lock:
+            self._counts[key] += value
+
+
+    def _put(self, target, item, name):
+        """
+        Puts item into a queue, waiting while it is full, and returns False if the pipeline was stopped
+        meanwhile. The time spent waiting is recorded as backpressure.
+        """
+        try:
+            target.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    target.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            metrics().observe("smk_pipeline_wait_seconds", time.perf_counter() - start, queue = name, side = "put")
+
+
+    def _get(self, source, name):
+        """Takes the next item from a queue, waiting while it is empty; returns DONE if the pipeline was stopped."""
+        try:
+            return source.get_nowait()
+        except queue.Empty:
+            pass
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return source.get(timeout = 0.1)
+                except queue.Empty:
+                    continue
+            return DONE
+        finally:
+            metrics().observe("smk_pipeline_wait_seconds", time.perf_counter() - start, queue = name, side = "get")
+
+
+    def _produce(self, pages, output):
+        """Puts the records of every page into the pages queue, writing them to output (if given) on the way."""
+        fout = codecs.open(output, "w", "utf8") if output is not None else None
+        try:
+            for offset, records, raw in pages:
+                if fout is not None:
+                    for record in records:
+                        fout.write(json.dumps(record, sort_keys = True, ensure_ascii = False) + "\n")
+                self._count("harvested", len(records))
+                if not self._put(self._pages, records, "pages"):
+                    break
+        except Exception as e:
+            self.stop(e)
+        finally:
+            close = getattr(pages, "close", None)
+            if close is not None:
+                # leave the fetch threads of iter_pages before the pipeline ends
+                close()
+            if fout is not None:
+                fout.close()
+            for i in range(self.transform_workers):
+                self._put(self._pages, DONE, "pages")
+
+
+    def _transform(self):
+        """Turns the records of the queued pages into batches of (item, row, hash) tuples."""
+        batch = []
+        try:
+            while True:
+                records = self._get(self._pages, "pages")
+                if records is DONE:
+                    break
+                start = time.perf_counter()
+                for item in records:
+                    try:
+                        row = clean_entry(item)
+                        batch.append((item, row, row_hash(row)))
+                    except Exception as e:
+                        self._reject(item, e)
+                        continue
+                    if len(batch) == self.batch_size:
+                        metrics().observe("smk_transform_seconds", time.perf_counter() - start, stage = "clean_entry")
+                        if not self._put(self._batches, batch, "batches"):
+                            return
+                        batch = []
+                        start = time.perf_counter()
+                metrics().observe("smk_transform_seconds", time.perf_counter() - start, stage = "clean_entry")
+            if batch and not self._stop.is_set():
+                self._put(self._batches, batch, "batches")
+        except Exception as e:
+            self.stop(e)
+
+
+    def _load(self):
+        """Upserts the queued batches on a connection of its own."""
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    while True:
+                        batch = self._get(self._batches, "batches")
+                        if batch is DONE:
+                            break
+                        changed = changed_rows(cursor, batch)
+                        self._count("skipped", len(batch) - len(changed))
+                        self._count("loaded", upsert_batch(connection, cursor, changed, self._reject))
+                finally:
+                    cursor.close()
+        except Exception as e:
+            self.stop(e)
+
+
+    def _reject(self, item, error):
+        """Writes an artwork that failed to load to the reject file."""
+        with self._lock:
+            self._counts["rejected"] += 1
+            self._reject_out.write(json.dumps({"entry": item, "error": str(error)}, ensure_ascii = False) + "\n")
+
+
+    def run(self, pages, output = None):
+        """
+        Loads the pages of an iterable of (offset, records, raw) tuples (see iter_pages in module
+        SMKAPItoJSONstr.py), writing the records to output if given, and returns a tuple (harvested, loaded,
+        skipped, rejected). The first error of any stage is raised after all stages have ended.
+        """
+        self._pages = queue.Queue(self.queue_size)
+        self._batches = queue.Queue(self.queue_size)
+        start = time.perf_counter()
+
+        self._reject_out = codecs.open(self.reject_path, "w", "utf8")
+        try:
+            producer = threading.Thread(target = self._produce, args = (pages, output), name = "pipeline-harvest")
+            transformers = [threading.Thread(target = self._transform, name = f"pipeline-transform-{i}")
+                            for i in range(self.transform_workers)]
+            loaders = [threading.Thread(target = self._load, name = f"pipeline-load-{i}")
+                       for i in range(self.loaders)]
+            for thread in [producer] + transformers + loaders:
+                thread.start()
+            try:
+                producer.join()
+                for thread in transformers:
+                    thread.join()
+                for i in range(self.loaders):
+                    self._put(self._batches, DONE, "batches")
+                for thread in loaders:
+                    thread.join()
+            except BaseException as e:
+                # e.g. KeyboardInterrupt: stop the stages and wait for them to end before leaving
+                self.stop()
+                for thread in [producer] + transformers + loaders:
+                    thread.join()
+                raise
+        finally:
+            self._reject_out.close()
+
+        if self._error is not None:
+            raise self._error
+        elapsed = time.perf_counter() - start
+        counts = self._counts
+        for result in ("loaded", "skipped", "rejected"):
+            metrics().inc("smk_load_rows_total", counts[result], result = result)
+        metrics().set("smk_load_rows_per_second", round(counts["loaded"] / elapsed if elapsed else 0))
+        print(f"Harvested {counts['harvested']} and loaded {counts['loaded']} rows in {elapsed:.2f} s "
+              f"({counts['loaded'] / elapsed if elapsed else 0:.0f} rows/sec), {counts['skipped']} unchanged rows "
+              f"skipped, {counts['rejected']} rejected (see {self.reject_path})")
+        return counts["harvested"], counts["loaded"], counts["skipped"], counts["rejected"]
+
+
+def harvest_and_load(full = True, max_workers = MAX_WORKERS, transform_workers = TRANSFORM_WORKERS,
+                     loaders = LOADERS, batch_size = BATCH_SIZE, queue_size = QUEUE_SIZE, output = OUTPUT_FILE,
+                     config = None, cache = None, api_url = API_URL, raise_errors = False):
+    """
+    Harvests the SMK API at api_url and loads the artworks into the SMKentries table in one pipelined pass
+    (see Pipeline), writing them to output as APItoJSON does. config holds the MySQL settings (see module
+    SMKpool.py); the database is created and migrated first. Returns a tuple (harvested, loaded, skipped,
+    rejected). Errors are printed; with raise_errors = True they are raised after printing.
+    """
+    from SMKmigrations import migrate
+    from SMKpool import create_database, db_config, get_pool
+
+    if config is None:
+        config = db_config()
+    create_database(config)
+    pool = get_pool(config, max_size = max(4, loaders))
+    with pool.connection() as connection:
+        migrate(connection)
+
+    pages = iter_pages(full = full, max_workers = max_workers, cache = cache, api_url = api_url)
+    pipeline = Pipeline(pool, transform_workers = transform_workers, loaders = loaders, batch_size = batch_size,
+                        queue_size = queue_size)
+    try:
+        return pipeline.run(pages, output)
+    except Exception as e:
+        print(f"The refresh stopped: {e}")
+        if raise_errors:
+            raise
+        return 0, 0, 0, 0
@@ -0,0 +1,175 @@
+"""
+This module provides a pool of PyMySQL connections shared by the loader (JSONtoMySQL.py) and the
+interactive menu (SMKinteraction.py). Connections are checked out with a context manager, pinged before
+use if they were idle for a while and reconnected if the server closed them, so long sessions survive
+idle timeouts and parallel loads do not pay the connection setup for every batch.
+
+The connection settings are read from the environment (SMK_MYSQL_HOST, SMK_MYSQL_USER,
+SMK_MYSQL_PASSWORD, SMK_MYSQL_PORT, SMK_MYSQL_DB) or from the [mysql] section of a config file (smk.ini);
+settings found in neither are asked from the user. pymysql is imported when the first connection is opened,
+so the settings can be read without it.
+
+Functions: db_config(path, interactive), create_database(config), get_pool(config, **connect_kwargs)
+Classes: ConnectionPool
+"""
+import configparser
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+CONFIG_FILE = "smk.ini"
+DATABASE = "SMK1"
+SETTINGS = [("host", "host name"), ("user", "user"), ("password", "password"), ("port", "port"),
+            ("db", "database")]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def db_config(path = CONFIG_FILE, interactive = True):
+    """
+    Returns the MySQL connection settings as a dictionary with the keys host, user, password, port and db.
+    Environment variables take precedence over the config file; missing settings are asked from the user
+    (the database defaults to SMK1), or raise ValueError with interactive = False (e.g. when run from cron).
+    """
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    section = parser["mysql"] if parser.has_section("mysql") else {}
+    config = {}
+    for key, description in SETTINGS:
+        value = os.environ.get("SMK_MYSQL_" + key.upper(), section.get(key))
+        if value is None and key == "db":
+            value = DATABASE
+        if value is None and not interactive:
+            raise ValueError(f"MySQL {description} is not set: set SMK_MYSQL_{key.upper()} or {key} in the "
+                             f"[mysql] section of {path}")
+        if value is None:
+            value = input(f"Please enter MySQL {description}: ")
+        config[key] = value
+    config["port"] = int(config["port"])
+    return config
+
+
+def create_database(config):
+    """Creates the database named in config if it does not exist."""
+    import pymysql
+
+    settings = dict(config)
+    name = settings.pop("db")
+    connection = pymysql.connect(**settings)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{name}`")
+    finally:
+        connection.close()
+
+
+class ConnectionPool():
+    """
+    A class representing a pool of MySQL connections.
+
+    Attributes:
+      min_size     : number of connections opened up front and kept open
+      max_size     : maximum number of connections checked out at the same time
+      ping_interval: seconds a connection may be idle before it is pinged on checkout
+      connect_kwargs: arguments for pymysql.connect
+
+    Methods:
+      __init__  : Initializes a ConnectionPool object and opens min_size connections
+      connection: Context manager that checks a live connection out of the pool and returns it
+      close     : Closes all idle connections
+    """
+
+    def __init__(self, min_size = 1, max_size = 4, ping_interval = 30, **connect_kwargs):
+        """Initializes a ConnectionPool object and opens min_size connections."""
+        self.min_size = min_size
+        self.max_size = max_size
+        self.ping_interval = ping_interval
+        self.connect_kwargs = connect_kwargs
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        for i in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+
+    def _connect(self):
+        """Opens a new connection."""
+        import pymysql
+
+        return pymysql.connect(**self.connect_kwargs)
+
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks a connection out of the pool, blocking while max_size connections are checked out. A
+        connection idle for longer than ping_interval is pinged and reconnected if needed. When the block
+        ends, its transaction is rolled back, so writers must commit; a read-only block thereby releases its
+        read view and the next checkout sees the current data. Connections that failed are closed instead of
+        returned.
+        """
+        import pymysql
+
+        self._slots.acquire()
+        connection = None
+        try:
+            with self._lock:
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    idle_since = None
+            if connection is None:
+                connection = self._connect()
+            elif time.monotonic() - idle_since > self.ping_interval:
+                connection.ping(reconnect = True)
+
+            try:
+                yield connection
+            finally:
+                # end the transaction of the block, also after reads: under REPEATABLE READ a connection
+                # returned with an open transaction would keep its first read view and never see later loads
+                try:
+                    if connection.open:
+                        connection.rollback()
+                except pymysql.err.Error:
+                    try:
+                        connection.close()
+                    except pymysql.err.Error:
+                        pass
+                    connection = None
+        finally:
+            if connection is not None and connection.open:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+            self._slots.release()
+
+
+    def close(self):
+        """Closes all idle connections."""
+        import pymysql
+
+        with self._lock:
+            while self._idle:
+                connection, idle_since = self._idle.pop()
+                try:
+                    connection.close()
+                except pymysql.err.Error:
+                    pass
+
+
+def get_pool(config = None, **connect_kwargs):
+    """
+    Returns the pool shared by the whole program, creating it on the first call from config (see db_config)
+    and connect_kwargs.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if config is None:
+                config = db_config()
+            _pool = ConnectionPool(**config, **connect_kwargs)
+        return _pool
@@ -0,0 +1,147 @@
+"""
+This module downloads artwork images into the image cache (see module SMKcache.py) in the background, so an
+image the user opens next is usually on disk already. When the artworks of an artist are listed, the
+screen sized renditions the menu opens of the listed artworks, those of the page just listed first, are
+queued on a small pool of threads (thumbnails only on request, as the menu does not show them); when the
+user moves on to other artworks, queued downloads that are no longer needed are cancelled. Downloads that already started are finished, as the cache writes every image atomically.
+
+The prefetcher counts how often an opened image was prefetched already (hit), was still being downloaded
+(wait) or had not been queued (miss).
+
+Use module SMKinteraction.py to prefetch the listed artworks with prefetcher().prefetch_artworks(artworks)
+and to open images with prefetcher().path(url).
+
+Functions: prefetcher()
+Classes: Prefetcher
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from SMKcache import image_cache
+from SMKimages import display_url, thumbnail_url
+from SMKmetrics import metrics
+
+
+class Prefetcher():
+    """
+    A class representing the background download of images into the image cache.
+
+    Attributes:
+      cache      : the ImageCache the images are downloaded into
+      max_pending: maximum number of images queued at a time
+      thumbnails : if True, the thumbnails are prefetched after the screen sized renditions
+
+    Methods:
+      __init__         : Initializes a Prefetcher object
+      prefetch         : Queues the download of a list of urls and cancels queued downloads of other urls
+      prefetch_artworks: Queues the renditions (and thumbnails) of a list of Artwork objects
+      cancel           : Cancels all queued downloads
+      path             : Returns the path of the cached image of a url, waiting for or starting its download
+      stats            : Returns the hit, wait, miss, cancelled and failed counts
+      shutdown         : Cancels queued downloads and stops the threads
+    """
+
+    def __init__(self, cache = None, max_workers = 4, max_pending = 64, thumbnails = False):
+        """Initializes a Prefetcher object."""
+        self.cache = cache or image_cache()
+        self.max_pending = max_pending
+        self.thumbnails = thumbnails
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "prefetch")
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._stats = {"hits": 0, "waits": 0, "misses": 0, "cancelled": 0, "failed": 0}
+
+
+    def prefetch(self, urls):
+        """
+        Queues the download of up to max_pending urls, in order. Queued downloads of urls that are not in
+        the list are cancelled; urls already queued or downloaded keep their download.
+        """
+        urls = list(dict.fromkeys(urls))[:self.max_pending]
+        with self._lock:
+            wanted = set(urls)
+            for url in [url for url in self._futures if url not in wanted]:
+                self._forget(url)
+            for url in urls:
+                if url not in self._futures:
+                    self._futures[url] = self._executor.submit(self.cache.path, url)
+
+
+    def prefetch_artworks(self, artworks):
+        """
+        Queues the screen sized renditions of a list of Artwork objects with an image, in order, then their
+        thumbnails if thumbnails is True. Pass the artworks the user is most likely to open first: only
+        max_pending images are queued.
+        """
+        iiif_ids = [artwork.iiif_id for artwork in artworks if artwork.iiif_id]
+        urls = [display_url(iiif_id) for iiif_id in iiif_ids]
+        if self.thumbnails:
+            urls += [thumbnail_url(iiif_id) for iiif_id in iiif_ids]
+        self.prefetch(urls)
+
+
+    def _forget(self, url):
+        """Cancels the download of a url if it is still queued and removes it; the lock must be held."""
+        future = self._futures.pop(url)
+        if future.cancel():
+            self._stats["cancelled"] += 1
+
+
+    def cancel(self):
+        """Cancels all queued downloads, e.g. when the user leaves the listed artworks."""
+        with self._lock:
+            for url in list(self._futures):
+                self._forget(url)
+
+
+    def path(self, url, timeout = 60):
+        """
+        Returns the path of the cached image of a url. A prefetched image is returned at once, an image
+        being downloaded is waited for and any other image is downloaded now.
+        """
+        with self._lock:
+            future = self._futures.get(url)
+            if future is None:
+                result = "misses"
+            else:
+                result = "hits" if future.done() else "waits"
+            self._stats[result] += 1
+        metrics().inc("smk_prefetch_requests_total", result = result)
+        if future is not None:
+            try:
+                return future.result(timeout)
+            except Exception:
+                # a failed prefetch is retried in the foreground, where the error reaches the user
+                with self._lock:
+                    self._stats["failed"] += 1
+                    if self._futures.get(url) is future:
+                        del self._futures[url]
+        return self.cache.path(url, timeout)
+
+
+    def stats(self):
+        """Returns a dictionary with the hit, wait, miss, cancelled and failed counts and the hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+        opened = stats["hits"] + stats["waits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / opened, 3) if opened else None
+        return stats
+
+
+    def shutdown(self):
+        """Cancels queued downloads and stops the threads without waiting for running downloads."""
+        self.cancel()
+        self._executor.shutdown(wait = False)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def prefetcher():
+    """Returns the Prefetcher shared by the whole program."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
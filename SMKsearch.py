@@ -0,0 +1,187 @@
+"""
+This module provides an in-memory search index over artist names. Names are normalized before they are
+indexed or searched: accents are removed, case is folded and the SMK form "Last, First" is folded to
+"first last", so "Heltoft, Ulrik", "Ulrik Heltoft" and "ulrik heltoft" find the same artist.
+
+The index supports
+1. exact lookups of a normalized name
+2. autocomplete: names of which a word starts with the given prefix, from a sorted list searched by bisection
+3. ranked fuzzy matches: names sharing the most trigrams (three letter sequences) with the query
+
+Use module SMKcatalog.py to build the index from the SMKentries table.
+
+Functions: normalize(name), trigrams(text)
+Classes: ArtistIndex
+"""
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import heappush, heappushpop
+
+
+def normalize(name):
+    """
+    Returns a name without accents and punctuation, case folded and with "Last, First" folded to "first last",
+    each of several names joined with ";" on its own.
+    """
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    parts = []
+    for part in text.split(";"):
+        last, comma, first = part.partition(",")
+        parts.append(f"{first} {last}" if comma and "," not in first else part)
+    return " ".join(re.sub(r"[^\w\s]", " ", " ".join(parts)).split())
+
+
+def trigrams(text):
+    """Returns the set of trigrams of a normalized text, padded so that word starts and ends count."""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+EMPTY = frozenset()
+# ArtistIndex.search finds no candidates by trigrams in more than this share of the names (and COMMON_MIN)
+COMMON_SHARE = 0.02
+COMMON_MIN = 200
+
+
+class _Reversed():
+    """A text that sorts in reverse order, so a heap of (score, text) keeps the alphabetically last text first."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+    def __lt__(self, other):
+        return other.text < self.text
+
+
+class ArtistIndex():
+    """
+    A class representing a search index over artist names.
+
+    Methods:
+      __init__: Initializes an ArtistIndex object with an iterable of names
+      add     : Adds a name to the index
+      lookup  : Returns the names that normalize to the same text as a name
+      complete: Returns the names of which a word starts with a prefix
+      search  : Returns the names most similar to a query with their scores
+      __len__ : Returns the number of distinct normalized names
+    """
+
+    def __init__(self, names = ()):
+        """Initializes an ArtistIndex object with an iterable of names."""
+        self._names = {}
+        self._postings = {}
+        self._sizes = {}
+        self._words = []
+        for name in names:
+            self._add(name, self._words.append)
+        self._words.sort()
+
+
+    def add(self, name):
+        """Adds a name to the index."""
+        self._add(name, lambda word: insort(self._words, word))
+
+
+    def _add(self, name, add_word):
+        """Adds a name to the index, adding its word suffixes for autocomplete with add_word."""
+        key = normalize(name)
+        if not key:
+            return
+        if key in self._names:
+            self._names[key].add(name)
+            return
+        self._names[key] = {name}
+        key_trigrams = trigrams(key)
+        self._sizes[key] = len(key_trigrams)
+        for trigram in key_trigrams:
+            self._postings.setdefault(trigram, set()).add(key)
+        words = key.split(" ")
+        for i in range(len(words)):
+            add_word((" ".join(words[i:]), key))
+
+
+    def lookup(self, name):
+        """Returns the sorted list of names that normalize to the same text as name."""
+        return sorted(self._names.get(normalize(name), ()))
+
+
+    def complete(self, prefix, limit = 10):
+        """Returns up to limit names of which a word starts with prefix, in alphabetical order."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        keys = []
+        for i in range(bisect_left(self._words, (prefix,)), len(self._words)):
+            text, key = self._words[i]
+            if not text.startswith(prefix) or len(keys) == limit:
+                break
+            if key not in keys:
+                keys.append(key)
+        return [name for key in sorted(keys) for name in sorted(self._names[key])][:limit]
+
+
+    def search(self, query, limit = 10, min_score = 0.3):
+        """
+        Returns up to limit (name, score) tuples of the names most similar to query, best first. The score
+        is the Dice coefficient of the trigrams of both names (1.0 for the same normalized name).
+
+        The candidates are the names that share a rare trigram with the query: the postings of the query
+        trigrams are read rarest first, and those of common trigrams (in more than COMMON_SHARE of the
+        names, e.g. of a frequent first name) only while no candidate was found, so a name that shares
+        nothing but common trigrams with the query is not suggested. The candidates are scored with all
+        query trigrams, in the order of the best score they can still reach, until that is below the
+        limit-th best score.
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        query_trigrams = trigrams(key)
+        q = len(query_trigrams)
+        postings = sorted((self._postings.get(trigram, EMPTY) for trigram in query_trigrams), key = len)
+        common = max(COMMON_MIN, int(len(self._names) * COMMON_SHARE))
+        shared = Counter()
+        read = 0
+        for posting in postings:
+            # a name in none of the postings read shares at most the others with the query
+            if 2 * (q - read) / (2 * q - read) < min_score or (len(posting) > common and shared):
+                break
+            shared.update(posting)
+            read += 1
+        rest = postings[read:]
+
+        best = []
+        threshold = min_score
+        for candidate, count in shared.most_common():
+            # names are met by descending count, and one sharing reach trigrams scores at most as one made of them
+            reach = count + len(rest)
+            if 2 * reach / (q + reach) < threshold:
+                break
+            size = self._sizes[candidate]
+            if 2 * min(reach, size) / (q + size) < threshold:
+                continue
+            for posting in rest:
+                if candidate in posting:
+                    count += 1
+            score = 2 * count / (q + self._sizes[candidate])
+            if score < threshold:
+                continue
+            if len(best) < limit:
+                heappush(best, (score, _Reversed(candidate)))
+            else:
+                heappushpop(best, (score, _Reversed(candidate)))
+            if len(best) == limit:
+                threshold = best[0][0]
+        scored = sorted(((score, wrapped.text) for score, wrapped in best), key = lambda entry: (-entry[0], entry[1]))
+        return [(name, round(score, 3)) for score, candidate in scored
+                for name in sorted(self._names[candidate])][:limit]
+
+
+    def __len__(self):
+        """Returns the number of distinct normalized names."""
+        return len(self._names)
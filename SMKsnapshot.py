@@ -0,0 +1,297 @@
+"""
+This module writes the SMKentries table to a compact binary snapshot file and browses it read-only without
+MySQL. A snapshot is opened with mmap: nothing is read or parsed up front, the operating system pages in the
+parts that are used, and several processes browsing the same snapshot share its pages. Lookups of an artist
+or an artwork id are binary searches over arrays viewed directly in the mapped file, and only the strings of
+the rows that are returned are decoded, so a snapshot opens in milliseconds whatever its size.
+
+The file consists of a header and five sections, all integers unsigned 32-bit little-endian:
+
+  header   : magic b"SMKSNAP1", version, rows, strings, artists, ids, bytes of string data
+  offsets  : strings + 1 offsets into the string data; string i is data[offsets[i]:offsets[i + 1]]
+  rows     : 5 string numbers per row (artist, frontend_url, id, production_date, image_iiif_id), NONE for
+             NULL; rows are sorted by artist and id
+  artists  : 3 numbers per artist (name string, first row, number of rows), sorted by name
+  ids      : the rows sorted by id
+  data     : the distinct strings in UTF-8, each stored once
+
+A snapshot is written from the database (export_snapshot) or, without a database, from the line-delimited
+JSON file of the harvest (jsonl_snapshot), and replaced atomically.
+
+Use python interface.py snapshot to write a snapshot and python interface.py browse --snapshot to browse it.
+
+Functions: write_snapshot(rows, path), export_snapshot(pool, path), jsonl_snapshot(jsonl_path, path)
+Classes: Snapshot, SnapshotCatalog
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from JSONtoMySQL import clean_entry, read_entries
+from SMKcatalog import Catalog
+from SMKmetrics import metrics
+from SMKsearch import ArtistIndex
+
+
+SNAPSHOT_FILE = "SMKsnapshot.bin"
+MAGIC = b"SMKSNAP1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIII")
+NONE = 0xFFFFFFFF
+FIELDS = 5
+
+
+def _little_endian(numbers):
+    """Returns an array of unsigned 32-bit integers as little-endian bytes."""
+    if sys.byteorder != "little":
+        numbers = array("I", numbers)
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+def write_snapshot(rows, path = SNAPSHOT_FILE):
+    """
+    Writes an iterable of (artist, frontend_url, id, production_date, image_iiif_id) tuples to a snapshot
+    file, replacing it atomically, and returns the number of rows written.
+    """
+    rows = sorted((tuple(value.decode("utf-8") if isinstance(value, bytes) else value for value in row)
+                   for row in rows), key = lambda row: (row[0] is None, row[0] or "", row[2] or ""))
+    strings = {}
+
+    def number(value):
+        return NONE if value is None else strings.setdefault(value, len(strings))
+
+    numbers = array("I")
+    artists = array("I")
+    for i, row in enumerate(rows):
+        numbers.extend(number(value) for value in row)
+        if row[0] is not None:
+            if artists and artists[-3] == numbers[i * FIELDS]:
+                artists[-1] += 1
+            else:
+                artists.extend((numbers[i * FIELDS], i, 1))
+    ids = array("I", sorted((i for i, row in enumerate(rows) if row[2] is not None),
+                            key = lambda i: rows[i][2]))
+
+    offsets = array("I", [0])
+    data = []
+    for value in strings:
+        encoded = value.encode("utf-8")
+        data.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as fout:
+        fout.write(HEADER.pack(MAGIC, VERSION, len(rows), len(strings), len(artists) // 3, len(ids), offsets[-1]))
+        for section in (offsets, numbers, artists, ids):
+            fout.write(_little_endian(section))
+        fout.writelines(data)
+    os.replace(temp_path, path)
+    return len(rows)
+
+
+def export_snapshot(pool, path = SNAPSHOT_FILE):
+    """
+    Writes the SMKentries table to a snapshot file, reading it with an unbuffered server-side cursor, and
+    returns the number of rows written.
+    """
+    import pymysql
+
+    with pool.connection() as connection, metrics().timer("smk_db_query_seconds", query = "snapshot"):
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        cursor.execute("SELECT artist, frontend_url, id, production_date, image_iiif_id FROM SMKentries")
+        try:
+            return write_snapshot(cursor, path)
+        finally:
+            cursor.close()
+
+
+def jsonl_snapshot(jsonl_path, path = SNAPSHOT_FILE):
+    """
+    Writes the artworks of a line-delimited JSON file of the harvest (see module SMKAPItoJSONstr.py) to a
+    snapshot file, cleaned as they are for the database, and returns the number of rows written.
+    """
+    return write_snapshot((clean_entry(item) for item in read_entries(jsonl_path)), path)
+
+
+class Snapshot():
+    """
+    A class representing a snapshot file mapped into memory.
+
+    Attributes:
+      path: path of the snapshot file
+
+    Methods:
+      __init__   : Initializes a Snapshot object and maps the file
+      row        : Returns a row as a tuple of strings
+      artist_rows: Returns the range of rows of an artist
+      artists    : Returns the names of all artists
+      find_id    : Returns the row of an artwork id, or None
+      close      : Unmaps the file
+      __len__    : Returns the number of rows
+      __enter__, __exit__: close the snapshot at the end of a with statement
+    """
+
+    def __init__(self, path = SNAPSHOT_FILE):
+        """Initializes a Snapshot object and maps the file; raises ValueError if it is not a snapshot."""
+        if sys.byteorder != "little":
+            raise ValueError("Snapshots are stored little-endian and can only be mapped on little-endian machines.")
+        self.path = path
+        with open(path, "rb") as fin:
+            self._mmap = mmap.mmap(fin.fileno(), 0, access = mmap.ACCESS_READ)
+        self._views = []
+        try:
+            magic, version, rows, strings, artists, ids, data_bytes = HEADER.unpack_from(self._mmap)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} SMK snapshot.")
+        sizes = (4 * (strings + 1), 4 * FIELDS * rows, 4 * 3 * artists, 4 * ids, data_bytes)
+        if HEADER.size + sum(sizes) > len(self._mmap):
+            self._mmap.close()
+            raise ValueError(f"{path} is truncated.")
+
+        view = memoryview(self._mmap)
+        self._views.append(view)
+        position = HEADER.size
+        sections = []
+        for size in sizes:
+            sections.append(view[position:position + size])
+            position += size
+        self._offsets, self._rows, self._artists, self._ids = (section.cast("I") for section in sections[:4])
+        self._data = sections[4]
+        self._views += sections + [self._offsets, self._rows, self._artists, self._ids]
+        self._count = rows
+
+
+    def _string(self, number):
+        """Returns string number decoded from the mapped data, or None for NONE."""
+        if number == NONE:
+            return None
+        return str(self._data[self._offsets[number]:self._offsets[number + 1]], "utf-8")
+
+
+    def row(self, row):
+        """Returns a row as a tuple (artist, frontend_url, id, production_date, image_iiif_id)."""
+        start = row * FIELDS
+        return tuple(self._string(number) for number in self._rows[start:start + FIELDS])
+
+
+    def _artist_name(self, i):
+        """Returns the name of artist number i."""
+        return self._string(self._artists[3 * i])
+
+
+    def artist_rows(self, name):
+        """Returns the range of rows of an artist, sorted by id; empty if the artist is not in the snapshot."""
+        count = len(self._artists) // 3
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._artist_name(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count and self._artist_name(low) == name:
+            first = self._artists[3 * low + 1]
+            return range(first, first + self._artists[3 * low + 2])
+        return range(0)
+
+
+    def artists(self):
+        """Yields the names of all artists in order."""
+        for i in range(len(self._artists) // 3):
+            yield self._artist_name(i)
+
+
+    def find_id(self, id):
+        """Returns the row of an artwork id, or None if the id is not in the snapshot."""
+        ids = self._ids
+        low, high = 0, len(ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(self._rows[ids[middle] * FIELDS + 2]) < id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(ids) and self._string(self._rows[ids[low] * FIELDS + 2]) == id:
+            return ids[low]
+        return None
+
+
+    def close(self):
+        """Unmaps the file; rows read before stay valid."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return self._count
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SnapshotCatalog(Catalog):
+    """
+    A class representing the artworks of a snapshot, loaded per artist on demand like those of the database
+    (see class Catalog of module SMKcatalog.py), for browsing without MySQL.
+
+    Attributes:
+      snapshot: the Snapshot object the artworks are read from
+
+    Methods:
+      __init__: Initializes a SnapshotCatalog object
+      index   : Returns the search index of all artist names in the snapshot, building it on the first call
+    """
+
+    def __init__(self, snapshot, page_size = 50, max_artists = 32):
+        """Initializes a SnapshotCatalog object."""
+        super().__init__(None, page_size, max_artists)
+        self.snapshot = snapshot
+
+
+    def _load(self, state):
+        """Adds the next page of artworks of an artist from the snapshot to it."""
+        from SMKinteraction import Artwork
+
+        artist = state["artist"]
+        rows = self.snapshot.artist_rows(state["db_name"])[state["count"]:state["count"] + self.page_size]
+        with metrics().timer("smk_snapshot_query_seconds", query = "artist_page"):
+            new_artworks = []
+            for row in rows:
+                db_artist, url, id, production_date, iiif_id = self.snapshot.row(row)
+                state["count"] += 1
+                artwork_name = f"{artist.name} - Artwork {state['count']}"
+                new_artworks.append(Artwork(artist, artwork_name, id, production_date, url, iiif_id))
+                state["last_id"] = id
+        state["complete"] = len(new_artworks) < self.page_size
+        artist.add_artworks(new_artworks)
+        return len(new_artworks)
+
+
+    def _artist_of(self, id):
+        """Returns the artist of an artwork id as stored in the snapshot, or None."""
+        row = self.snapshot.find_id(id)
+        return self.snapshot.row(row)[0] if row is not None else None
+
+
+    def index(self):
+        """Returns the search index of all artist names in the snapshot, building it on the first call."""
+        if self._index is None:
+            with metrics().timer("smk_snapshot_query_seconds", query = "artist_index"):
+                self._index = ArtistIndex(self.snapshot.artists())
+            for name in self._created:
+                self._index.add(name)
+        return self._index
@@ -1,18 +1,318 @@
-""" 
-This module imports all modules and functionalities required for the project. First, the SMKAPItoJSONstr
-module saves artwork data from the National Gallery of Denmark (SMK) as JSON file. Second, the module 
-JSONtoMySQL connects to the MySQL server, creates a SMK database and stores data from the JSON file in 
-the database. Third, the module SMKinteraction interacts with the MySQL database and allows the user to
-manage and view artwork entries.
 """
+This module is the entry point of the project. Every stage runs on its own, so harvest and load can be
+scheduled (e.g. in cron) and the menu starts without running them:
 
-import pymysql
-from SMKAPItoJSONstr import APItoJSON
-from SMKinteraction import Menu, User
-from JSONtoMySQL import JSONtoMySQL
+  python interface.py harvest [--full] [--incremental]   artwork data from the SMK API to SMKselstr.jsonl
+  python interface.py load [--load-data]                  SMKselstr.jsonl into the MySQL SMK database
+  python interface.py refresh [--full] [--loaders 3]      harvest and load at the same time
+  python interface.py browse [--snapshot SMKsnapshot.bin] the interactive menu (the default)
+  python interface.py snapshot [--input SMKselstr.jsonl]  the SMKentries table as read-only snapshot file
+  python interface.py verify [--sample 10]                counts, checksum, sample rows and indexes of SMKentries
+  python interface.py export [--output SMKexport.jsonl]   the SMKentries table as line-delimited JSON
+  python interface.py bench                               the benchmarks of module SMKbenchmark.py
 
-# calling the modules
-APItoJSON()
-connection = JSONtoMySQL()
-user_name = input("Please enter your name: ")
-user_menu = Menu(User(user_name), connection)   
+First, the SMKAPItoJSONstr module saves artwork data from the National Gallery of Denmark (SMK) as JSON
+file. Second, the module JSONtoMySQL connects to the MySQL server, creates a SMK database and stores data
+from the JSON file in the database. Third, the module SMKinteraction interacts with the MySQL database and
+allows the user to manage and view artwork entries, with connections drawn from the pool of module
+SMKpool.py.
+
+The MySQL settings are read from the environment or a config file (see module SMKpool.py); only browse asks
+for missing settings. browse --snapshot needs no database at all (see module SMKsnapshot.py). A harvest is
+skipped while its output was started less than --max-age hours ago and a load is skipped while its input has
+not changed since the last load; the completed stages are recorded in SMKstages.json and --force runs a stage
+anyway. A refresh (module SMKpipeline.py) always runs and is recorded as both a harvest and a load. With
+--metrics-log and --metrics-textfile the timings and counters of the run are written as JSON lines and as a
+Prometheus textfile (see module SMKmetrics.py). The modules of a stage are imported when it runs, so every
+stage starts without loading the others; options left out take the defaults of those modules.
+
+Functions: load_stages(path), save_stages(stages, path), file_state(path), harvest(args), load(args),
+refresh(args), verify(args), browse(args), snapshot(args), export(args), bench(args), main(argv)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from SMKmetrics import metrics
+from SMKpool import CONFIG_FILE, db_config, get_pool
+
+
+STAGES_FILE = "SMKstages.json"
+EXPORT_FILE = "SMKexport.jsonl"
+
+
+def load_stages(path = STAGES_FILE):
+    """Returns the recorded state of the completed stages, an empty dictionary if there is none."""
+    try:
+        with open(path, "r") as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_stages(stages, path = STAGES_FILE):
+    """Saves the state of the completed stages, replacing the file atomically."""
+    temp_path = path + ".part"
+    with open(temp_path, "w") as fout:
+        json.dump(stages, fout, indent = 1)
+    os.replace(temp_path, path)
+
+
+def file_state(path):
+    """Returns the size and modification time of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def harvest(args):
+    """
+    Harvests the SMK API to args.output unless the last harvest started less than args.max_age hours ago and
+    its output still covers this one: a harvest of only the new or changed artworks (--incremental) never
+    stands in for a plain one.
+    """
+    from SMKAPItoJSONstr import APItoJSON, MAX_WORKERS, OUTPUT_FILE
+
+    args.output = args.output or OUTPUT_FILE
+    stages = load_stages()
+    last = stages.get("harvest")
+    current = file_state(args.output)
+    if (not args.force and last is not None and last["output"] == current and last["full"] >= args.full
+            and (args.incremental or not last["incremental"])
+            and time.time() - last.get("started_at", last["finished_at"]) < args.max_age * 3600):
+        print(f"Harvest skipped: {args.output} was harvested less than {args.max_age} hours ago (use --force)")
+        return 0
+    from SMKcache import ResponseCache
+
+    cache = ResponseCache(cache_only = args.cache_only) if args.cache or args.cache_only else None
+    started_at = time.time()
+    count = APItoJSON(full = args.full, max_workers = args.workers or MAX_WORKERS, output = args.output,
+                      incremental = args.incremental, cache = cache, raise_errors = True)
+    stages["harvest"] = {"output": file_state(args.output), "full": args.full, "incremental": args.incremental,
+                         "count": count, "started_at": started_at, "finished_at": time.time()}
+    save_stages(stages)
+    return 0
+
+
+def load(args):
+    """Loads args.input into the SMK database unless it has not changed since the last load."""
+    from JSONtoMySQL import BATCH_SIZE, JSONtoMySQL
+    from SMKAPItoJSONstr import OUTPUT_FILE, commit_checkpoint
+
+    args.input = args.input or OUTPUT_FILE
+    stages = load_stages()
+    current = file_state(args.input)
+    if current is None:
+        print(f"Nothing to load: {args.input} does not exist. Run 'python interface.py harvest' first.")
+        return 1
+    if not args.force and stages.get("load", {}).get("input") == current:
+        print(f"Load skipped: {args.input} has not changed since the last load (use --force)")
+        return 0
+    pool = JSONtoMySQL(args.input, batch_size = args.batch_size or BATCH_SIZE, load_data = args.load_data,
+                       config = db_config(args.config, interactive = False), raise_errors = True)
+    pool.close()
+    committed = commit_checkpoint(args.input)
+    if committed:
+        print(f"Recorded {committed} new or changed artworks of the incremental harvest as loaded")
+    stages["load"] = {"input": current, "finished_at": time.time()}
+    save_stages(stages)
+    return 0
+
+
+def refresh(args):
+    """Harvests the SMK API and loads the artworks into the SMK database in one pipelined pass."""
+    from JSONtoMySQL import BATCH_SIZE
+    from SMKAPItoJSONstr import MAX_WORKERS, OUTPUT_FILE
+    from SMKcache import ResponseCache
+    from SMKpipeline import LOADERS, QUEUE_SIZE, TRANSFORM_WORKERS, harvest_and_load
+
+    args.output = args.output or OUTPUT_FILE
+    cache = ResponseCache(cache_only = args.cache_only) if args.cache or args.cache_only else None
+    started_at = time.time()
+    harvested, loaded, skipped, rejected = harvest_and_load(
+        full = args.full, max_workers = args.workers or MAX_WORKERS,
+        transform_workers = args.transform_workers or TRANSFORM_WORKERS, loaders = args.loaders or LOADERS,
+        batch_size = args.batch_size or BATCH_SIZE, queue_size = args.queue_size or QUEUE_SIZE, output = args.output,
+        config = db_config(args.config, interactive = False), cache = cache, raise_errors = True)
+    stages = load_stages()
+    finished_at = time.time()
+    stages["harvest"] = {"output": file_state(args.output), "full": args.full, "incremental": False,
+                         "count": harvested, "started_at": started_at, "finished_at": finished_at}
+    stages["load"] = {"input": file_state(args.output), "finished_at": finished_at}
+    save_stages(stages)
+    return 0
+
+
+def verify(args):
+    """
+    Checks the SMKentries table and that its hot queries use an index, and reports whether it changed since
+    the last verification.
+    """
+    from JSONtoMySQL import verify as verify_table
+    from SMKmigrations import check_indexes
+
+    pool = get_pool(db_config(args.config, interactive = False))
+    with pool.connection() as connection:
+        summary = verify_table(connection, sample = args.sample, top_artists = args.top_artists)
+        scans = [name for name, key, ok in check_indexes(connection) if not ok]
+    stages = load_stages()
+    last = stages.get("verify")
+    if last is not None:
+        changed = (last["rows"], last["checksum"]) != (summary["rows"], summary["checksum"])
+        print(f"The table has {'changed' if changed else 'not changed'} since the last verification.")
+    stages["verify"] = {"rows": summary["rows"], "checksum": summary["checksum"], "finished_at": time.time()}
+    save_stages(stages)
+    if scans:
+        print(f"Full table scans: {', '.join(scans)}. Run 'python interface.py load' to apply the migrations.")
+    return 1 if summary["duplicate_ids"] or scans else 0
+
+
+def browse(args):
+    """Opens the interactive menu on the SMK database or, with --snapshot, read-only on a snapshot file."""
+    from SMKinteraction import Menu, User
+
+    if args.snapshot:
+        from SMKsnapshot import Snapshot, SnapshotCatalog
+
+        catalog = SnapshotCatalog(Snapshot(args.snapshot))
+        print(f"Browsing the snapshot {args.snapshot} read-only: edits are not saved.")
+        user_name = input("Please enter your name: ")
+        Menu(User(user_name), None, catalog = catalog)
+        return 0
+    pool = get_pool(db_config(args.config))
+    user_name = input("Please enter your name: ")
+    Menu(User(user_name), pool)
+    return 0
+
+
+def snapshot(args):
+    """Writes the SMKentries table (or, with --input, a harvest file) to a snapshot file."""
+    from SMKsnapshot import SNAPSHOT_FILE, export_snapshot, jsonl_snapshot
+
+    args.output = args.output or SNAPSHOT_FILE
+    if args.input:
+        count = jsonl_snapshot(args.input, args.output)
+    else:
+        count = export_snapshot(get_pool(db_config(args.config, interactive = False)), args.output)
+    print(f"Wrote {count} artworks to the snapshot {args.output}")
+    return 0
+
+
+def export(args):
+    """Writes the SMKentries table to args.output as line-delimited JSON, in the format of the harvest."""
+    import pymysql
+
+    pool = get_pool(db_config(args.config, interactive = False))
+    count = 0
+    with pool.connection() as connection, open(args.output, "w", encoding = "utf8") as fout:
+        cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute("""SELECT artist, frontend_url, id, production_date, image_iiif_id FROM SMKentries
+                       ORDER BY id""")
+        for row in cursor:
+            fout.write(json.dumps(row, sort_keys = True, ensure_ascii = False) + "\n")
+            count += 1
+        cursor.close()
+    print(f"Exported {count} artworks to {args.output}")
+    return 0
+
+
+def bench(args):
+    """Runs the benchmarks of module SMKbenchmark.py."""
+    from SMKbenchmark import main as bench_main
+    argv = (["--output", args.output] + ["--stages"] * args.stages + ["--mysql"] * args.mysql
+            + ["--imports"] * args.imports)
+    if args.sizes:
+        argv += ["--sizes"] + [str(size) for size in args.sizes]
+    if args.baseline:
+        argv += ["--baseline", args.baseline]
+    return bench_main(argv)
+
+
+def main(argv = None):
+    """Runs the stage selected on the command line and returns the exit status."""
+    parser = argparse.ArgumentParser(description = "SMK artworks: harvest, load, refresh, browse and export.")
+    parser.add_argument("--config", default = CONFIG_FILE, help = "config file with a [mysql] section")
+    parser.add_argument("--metrics-log", help = "append timings as JSON lines to this file (see SMKmetrics.py)")
+    parser.add_argument("--metrics-textfile", help = "write the metrics to this Prometheus textfile at exit")
+    stages = parser.add_subparsers(dest = "stage")
+
+    harvest_parser = stages.add_parser("harvest", help = "harvest the SMK API to line-delimited JSON")
+    harvest_parser.add_argument("--output", help = "default SMKselstr.jsonl")
+    harvest_parser.add_argument("--full", action = "store_true", help = "harvest the whole collection")
+    harvest_parser.add_argument("--incremental", action = "store_true", help = "write new or changed artworks only")
+    harvest_parser.add_argument("--workers", type = int, help = "pages fetched concurrently (default 4)")
+    harvest_parser.add_argument("--cache", action = "store_true", help = "serve repeated queries from .smk_cache")
+    harvest_parser.add_argument("--cache-only", action = "store_true", help = "never use the network")
+    harvest_parser.add_argument("--max-age", type = float, default = 20,
+                                help = "hours after its start a harvest stays current (default 20, so nightly runs "
+                                "are never skipped)")
+    harvest_parser.add_argument("--force", action = "store_true", help = "harvest even if the output is current")
+    harvest_parser.set_defaults(func = harvest)
+
+    load_parser = stages.add_parser("load", help = "load line-delimited JSON into the SMK database")
+    load_parser.add_argument("--input", help = "default SMKselstr.jsonl")
+    load_parser.add_argument("--batch-size", type = int, help = "rows per batch (default 1000)")
+    load_parser.add_argument("--load-data", action = "store_true", help = "load with LOAD DATA LOCAL INFILE")
+    load_parser.add_argument("--force", action = "store_true", help = "load even if the input did not change")
+    load_parser.set_defaults(func = load)
+
+    refresh_parser = stages.add_parser("refresh", help = "harvest and load at the same time")
+    refresh_parser.add_argument("--output", help = "default SMKselstr.jsonl")
+    refresh_parser.add_argument("--full", action = "store_true", help = "harvest the whole collection")
+    refresh_parser.add_argument("--workers", type = int, help = "pages fetched concurrently (default 4)")
+    refresh_parser.add_argument("--transform-workers", type = int, help = "default 2")
+    refresh_parser.add_argument("--loaders", type = int, help = "connections loading concurrently (default 3)")
+    refresh_parser.add_argument("--batch-size", type = int, help = "rows per batch (default 1000)")
+    refresh_parser.add_argument("--queue-size", type = int,
+                                help = "pages and batches waiting between stages (default 8)")
+    refresh_parser.add_argument("--cache", action = "store_true", help = "serve repeated queries from .smk_cache")
+    refresh_parser.add_argument("--cache-only", action = "store_true", help = "never use the network")
+    refresh_parser.set_defaults(func = refresh)
+
+    browse_parser = stages.add_parser("browse", help = "open the interactive menu")
+    browse_parser.add_argument("--snapshot", help = "browse this snapshot file read-only, without MySQL")
+    browse_parser.set_defaults(func = browse)
+
+    verify_parser = stages.add_parser("verify", help = "check the SMK database and print a summary")
+    verify_parser.add_argument("--sample", type = int, default = 10, help = "sample rows to print")
+    verify_parser.add_argument("--top-artists", type = int, default = 10, help = "artists with most artworks to print")
+    verify_parser.set_defaults(func = verify)
+
+    snapshot_parser = stages.add_parser("snapshot", help = "write the SMK database to a snapshot file")
+    snapshot_parser.add_argument("--output", help = "default SMKsnapshot.bin")
+    snapshot_parser.add_argument("--input", help = "read this harvest file instead of the database")
+    snapshot_parser.set_defaults(func = snapshot)
+
+    export_parser = stages.add_parser("export", help = "export the SMK database to line-delimited JSON")
+    export_parser.add_argument("--output", default = EXPORT_FILE)
+    export_parser.set_defaults(func = export)
+
+    bench_parser = stages.add_parser("bench", help = "run the benchmarks")
+    bench_parser.add_argument("--stages", action = "store_true", help = "benchmark harvest, transform, load and menu")
+    bench_parser.add_argument("--mysql", action = "store_true", help = "load into MySQL instead of a stand-in")
+    bench_parser.add_argument("--sizes", type = int, nargs = "+")
+    bench_parser.add_argument("--output", default = "SMKbench.json")
+    bench_parser.add_argument("--baseline", help = "results of an earlier run to compare with")
+    bench_parser.add_argument("--imports", action = "store_true", help = "check the import time budget")
+    bench_parser.set_defaults(func = bench)
+
+    args = parser.parse_args(argv)
+    if args.stage is None:
+        args = parser.parse_args((argv or sys.argv[1:]) + ["browse"])
+    metrics().configure(args.metrics_log, args.metrics_textfile)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(e)
+        return 2
+    except Exception as e:
+        print(f"The {args.stage} stage failed: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
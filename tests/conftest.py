@@ -0,0 +1,5 @@
+"""The modules of the project are top-level modules in the parent directory of the tests."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,120 @@
+"""
+Tests of the response cache of module SMKcache.py against a local stand-in of the SMK API (module
+SMKfakeapi.py): freshness within the TTL, revalidation with ETag and Last-Modified, least recently used
+eviction and cache-only mode.
+
+Run from the project directory: python -m pytest tests
+"""
+import json
+import os
+
+import pytest
+import requests
+
+from SMKcache import CacheMiss, ResponseCache
+from SMKfakeapi import FakeSMKAPI
+
+
+@pytest.fixture
+def api():
+    with FakeSMKAPI(records = 50) as api:
+        yield api
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+
+def page(offset):
+    return {"offset": offset, "rows": 5}
+
+
+def read(cache, session, api, offset = 0):
+    with cache.open(session, api.url, page(offset)) as fin:
+        return json.load(fin)
+
+
+def statuses(api):
+    return [status for offset, rows, status in api.served]
+
+
+def test_fresh_response_is_served_from_disk(tmp_path, api, session):
+    cache = ResponseCache(str(tmp_path))
+    first = read(cache, session, api)
+    assert read(cache, session, api) == first
+    assert statuses(api) == [200]
+
+
+def test_key_ignores_the_order_of_parameters(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.key("u", {"offset": 0, "rows": 5}) == cache.key("u", {"rows": 5, "offset": 0})
+    assert cache.key("u", {"offset": 0, "rows": 5}) != cache.key("u", {"offset": 5, "rows": 5})
+
+
+def test_stale_response_is_revalidated_with_etag(tmp_path, api, session):
+    cache = ResponseCache(str(tmp_path), ttl = 0)
+    first = read(cache, session, api)
+    assert read(cache, session, api) == first
+    assert statuses(api) == [200, 304]
+
+
+def test_stale_response_is_revalidated_with_last_modified(tmp_path, api, session):
+    api.etags = False
+    cache = ResponseCache(str(tmp_path), ttl = 0)
+    first = read(cache, session, api)
+    assert read(cache, session, api) == first
+    assert statuses(api) == [200, 304]
+
+
+def test_changed_response_is_downloaded_again(tmp_path, api, session):
+    cache = ResponseCache(str(tmp_path), ttl = 0)
+    assert read(cache, session, api)["found"] == 50
+    api.records = 60
+    assert read(cache, session, api)["found"] == 60
+    assert statuses(api) == [200, 200]
+
+
+def test_revalidation_renews_the_ttl(tmp_path, api, session):
+    cache = ResponseCache(str(tmp_path), ttl = 0)
+    read(cache, session, api)
+    read(cache, session, api)
+    cache.ttl = 3600
+    read(cache, session, api)
+    assert statuses(api) == [200, 304]
+
+
+def test_least_recently_used_response_is_evicted(tmp_path, api, session):
+    cache = ResponseCache(str(tmp_path))
+    paths = [cache.fetch(session, api.url, page(offset)) for offset in (0, 5)]
+    size = max(os.path.getsize(path) for path in paths)
+    os.utime(paths[0], (1000, 1000))
+    os.utime(paths[1], (2000, 2000))
+    # serving the first page makes it the most recently used one
+    read(cache, session, api, 0)
+    cache.max_bytes = 2 * size + size // 2
+    cache.fetch(session, api.url, page(10))
+
+    assert os.path.exists(paths[0])
+    assert not os.path.exists(paths[1])
+    assert not os.path.exists(paths[1][:-len(".body")] + ".json")
+    read(cache, session, api, 5)
+    assert statuses(api) == [200, 200, 200, 200]
+
+
+def test_cache_only_raises_cache_miss(tmp_path, api, session):
+    cache = ResponseCache(str(tmp_path), cache_only = True)
+    with pytest.raises(CacheMiss):
+        cache.fetch(session, api.url, page(0))
+    assert isinstance(CacheMiss(), requests.exceptions.RequestException)
+    assert api.served == []
+
+
+def test_cache_only_serves_stale_responses(tmp_path, api, session):
+    first = read(ResponseCache(str(tmp_path)), session, api)
+    cache = ResponseCache(str(tmp_path), ttl = 0, cache_only = True)
+    assert read(cache, session, api) == first
+    with pytest.raises(CacheMiss):
+        cache.fetch(session, api.url, page(5))
+    assert statuses(api) == [200]
@@ -0,0 +1,220 @@
+"""
+Tests of the write-behind journal of module SMKjournal.py: coalescing the edits of a flush per artwork,
+and replaying the journal file after the program stopped before its edits were flushed, against a stand-in
+of the connection pool of module SMKpool.py that records the statements instead of running them.
+
+Run from the project directory: python -m pytest tests
+"""
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from JSONtoMySQL import row_hash
+from SMKjournal import Journal, coalesce
+
+
+class FakeCursor():
+    def __init__(self, pool):
+        self.pool = pool
+
+
+    def execute(self, sql, args):
+        self.pool.pending.append((sql.split()[0], args))
+
+
+    def executemany(self, sql, args):
+        self.pool.pending.extend((sql.split()[0], arg) for arg in args)
+
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+    def __init__(self, pool):
+        self.pool = pool
+
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+
+    def commit(self):
+        self.pool.committed.append(self.pool.pending)
+        self.pool.pending = []
+
+
+class FakePool():
+    """Records the statements of each committed transaction; raises instead while down is set."""
+
+    def __init__(self, down = False):
+        self.down = down
+        self.pending = []
+        self.committed = []
+
+
+    @contextmanager
+    def connection(self):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        self.pending = []
+        yield FakeConnection(self)
+
+
+def row(id_number, artist = "Hammershøi, Vilhelm", year = "1900"):
+    return {"artist": artist, "frontend_url": None, "id": id_number, "production_date": year,
+            "image_iiif_id": None}
+
+
+def artwork(id_number, artist = "Hammershøi, Vilhelm", year = "1900"):
+    return SimpleNamespace(artist = SimpleNamespace(db_name = artist), url = "no url entered",
+                           id_number = id_number, year = year, iiif_id = None)
+
+
+def create(id_number, **columns):
+    return {"op": "create", "row": row(id_number, **columns)}
+
+
+def update(old, new, **columns):
+    return {"op": "update", "id": old, "row": row(new, **columns)}
+
+
+def delete(id_number):
+    return {"op": "delete", "id": id_number}
+
+
+def rename(old, new):
+    return {"op": "rename_artist", "old": old, "new": new}
+
+
+@pytest.mark.parametrize("records, expected", [
+    ([], ([], [], [])),
+    ([update("KMS1", "KMS1", year = "1901"), update("KMS1", "KMS1", year = "1902")],
+     ([], [], [row("KMS1", year = "1902")])),
+    ([delete("KMS1")], ([], ["KMS1"], [])),
+    ([create("KMS9"), update("KMS9", "KMS9", year = "1950"), delete("KMS9")], ([], [], [])),
+    ([update("KMS1", "KMS2")], ([], ["KMS1"], [row("KMS2")])),
+    ([update("KMS1", "KMS2"), update("KMS2", "KMS3")], ([], ["KMS1"], [row("KMS3")])),
+    ([update("KMS1", "KMS2"), delete("KMS2")], ([], ["KMS1"], [])),
+    ([update("KMS1", "KMS2"), update("KMS2", "KMS1")], ([], [], [row("KMS1")])),
+    ([create("KMS9"), update("KMS9", "KMS10")], ([], [], [row("KMS10")])),
+    ([delete("KMS1"), create("KMS1", year = "1999")], ([], [], [row("KMS1", year = "1999")])),
+    ([update("KMS1", "KMS1"), update("KMS5", "KMS5", artist = "Ancher, Anna"),
+      rename("Hammershøi, Vilhelm", "Hammershøi")],
+     ([("Hammershøi, Vilhelm", "Hammershøi")], [],
+      [row("KMS1", artist = "Hammershøi"), row("KMS5", artist = "Ancher, Anna")])),
+    ([rename("A", "B"), create("KMS9", artist = "A")], ([("A", "B")], [], [row("KMS9", artist = "A")])),
+])
+def test_coalesce(records, expected):
+    assert coalesce(records) == expected
+
+
+def test_coalesce_leaves_the_records_unchanged():
+    records = [update("KMS1", "KMS1"), rename("Hammershøi, Vilhelm", "Hammershøi")]
+    coalesce(records)
+    assert records[0]["row"] == row("KMS1")
+
+
+def numbered(*records):
+    return [dict(record, seq = seq) for seq, record in enumerate(records, 1)]
+
+
+def write_lines(path, records, tail = ""):
+    with open(path, "a", encoding = "utf8") as fout:
+        for record in records:
+            fout.write(json.dumps(record) + "\n")
+        fout.write(tail)
+
+
+def read_lines(path):
+    with open(path, "r", encoding = "utf8") as fin:
+        return [json.loads(line) for line in fin]
+
+
+def crash(journal):
+    """Stops a journal the way the program stopping does: without a last flush."""
+    journal._closed = True
+    journal._stop.set()
+    journal._thread.join()
+    journal._log.close()
+
+
+EDITS = numbered(update("KMS1", "KMS1", year = "1901"), delete("KMS2"), create("KMS9"), update("KMS1", "KMS7"))
+
+
+@pytest.mark.parametrize("lines, tail, pending", [
+    (EDITS, "", [1, 2, 3, 4]),
+    (EDITS[:2] + [{"op": "flushed", "seq": 2}] + EDITS[2:], "", [3, 4]),
+    (EDITS + [{"op": "flushed", "seq": 4}], "", []),
+    (EDITS[:3] + [{"op": "flushed", "seq": 1}], '{"op": "update", "id": "KM', [2, 3]),
+    (EDITS[:1], '{"op": "delete", "id": "KMS2", "se', [1]),
+    ([], "", []),
+])
+def test_replay_skips_flushed_edits_and_a_torn_last_line(tmp_path, lines, tail, pending):
+    path = str(tmp_path / "journal.jsonl")
+    write_lines(path, lines, tail)
+    journal = Journal(FakePool(down = True), path, interval = 3600)
+    try:
+        assert journal.pending() == len(pending)
+        # the journal file is rewritten with the pending edits only, so the torn line does not stay in it
+        assert [record["seq"] for record in read_lines(path)] == pending
+    finally:
+        crash(journal)
+
+
+def test_edits_are_replayed_after_a_crash(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(FakePool(down = True), path, interval = 3600)
+    journal.updated(artwork("KMS1", year = "1901"), "year", "1900")
+    journal.updated(artwork("KMS7", year = "1901"), "id_number", "KMS1")
+    journal.deleted(artwork("KMS2"))
+    journal.created(artwork("KMS9"))
+    journal.deleted(artwork("KMS9"))
+    crash(journal)
+    write_lines(path, [], '{"op": "create", "row": {"artist"')
+
+    pool = FakePool()
+    journal = Journal(pool, path, interval = 3600)
+    try:
+        inserted = ("Hammershøi, Vilhelm", None, "KMS7", "1901", None)
+        assert pool.committed == [[("DELETE", "KMS1"), ("DELETE", "KMS2"),
+                                   ("INSERT", inserted + (row_hash(inserted),))]]
+        assert journal.pending() == 0
+        assert read_lines(path) == []
+    finally:
+        journal.close()
+
+
+def test_only_the_edits_after_the_last_flush_are_replayed(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    pool = FakePool()
+    journal = Journal(pool, path, interval = 3600)
+    journal.deleted(artwork("KMS1"))
+    assert journal.flush() == 1
+    journal.deleted(artwork("KMS2"))
+    crash(journal)
+
+    pool = FakePool()
+    journal = Journal(pool, path, interval = 3600)
+    try:
+        assert pool.committed == [[("DELETE", "KMS2")]]
+    finally:
+        journal.close()
+
+
+def test_failed_flush_keeps_the_edits_for_the_next_start(tmp_path, capsys):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(FakePool(down = True), path, interval = 3600)
+    journal.deleted(artwork("KMS1"))
+    journal.close()
+    assert "will be saved on the next start" in capsys.readouterr().out
+
+    pool = FakePool()
+    journal = Journal(pool, path, interval = 3600)
+    try:
+        assert "Replaying 1 unsaved edits" in capsys.readouterr().out
+        assert pool.committed == [[("DELETE", "KMS1")]]
+    finally:
+        journal.close()
@@ -0,0 +1,74 @@
+"""
+Tests of the ranked fuzzy search of module SMKsearch.py against scoring every name of the index, on names
+that share a few frequent first names like the SMK artists do.
+
+Run from the project directory: python -m pytest tests
+"""
+import random
+
+import pytest
+
+from SMKsearch import ArtistIndex, normalize, trigrams
+
+FIRST_NAMES = ["Anna", "Peter", "Jens", "Marie", "Søren", "Karen", "Niels", "Ursula"]
+
+
+def random_name(rng):
+    last = "".join(rng.choice("abdefghiklmnoprstuvyæø") for _ in range(rng.randint(4, 9))).capitalize()
+    return f"{last}, {rng.choice(FIRST_NAMES)}"
+
+
+@pytest.fixture(scope = "module")
+def names():
+    rng = random.Random(11)
+    return sorted({random_name(rng) for _ in range(3000)})
+
+
+@pytest.fixture(scope = "module")
+def index(names):
+    return ArtistIndex(names)
+
+
+def dice(query, name):
+    query_trigrams, name_trigrams = trigrams(normalize(query)), trigrams(normalize(name))
+    return 2 * len(query_trigrams & name_trigrams) / (len(query_trigrams) + len(name_trigrams))
+
+
+def typo(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + name[i + 1:]
+
+
+@pytest.mark.parametrize("limit", [1, 5, 10])
+def test_scores_are_exact_and_best_first(index, names, limit):
+    rng = random.Random(limit)
+    for query in [typo(rng.choice(names), rng) for _ in range(50)]:
+        results = index.search(query, limit)
+        assert 0 < len(results) <= limit
+        assert [score for name, score in results] == sorted((score for name, score in results), reverse = True)
+        for name, score in results:
+            assert score == round(dice(query, name), 3)
+        assert results[0][1] == round(max(dice(query, name) for name in names), 3)
+
+
+def test_same_name_scores_one(index, names):
+    for name in names[:20]:
+        assert (name, 1.0) in index.search(normalize(name), 5)
+
+
+def test_name_sharing_only_a_common_first_name_is_not_suggested(names):
+    index = ArtistIndex(names + ["Xolbrand, Peter"])
+    first_name = trigrams("anna")
+    results = index.search("Xolbrand Anna")
+    assert results[0][0] == "Xolbrand, Peter"
+    # by their score names like "Heltoft, Anna" would follow, but they share nothing else with the query
+    assert any(dice("Xolbrand Anna", name) >= 0.3 for name in names if name.endswith(", Anna"))
+    for name, score in results:
+        assert trigrams(normalize(name)) & trigrams("xolbrand anna") - first_name
+
+
+def test_query_of_common_trigrams_only_still_finds_names(index):
+    results = index.search("Anna")
+    assert results != []
+    assert all(name.endswith(", Anna") for name, score in results)
+    assert index.search("zzzz xxxx") == []
@@ -0,0 +1,13 @@
+"""
+Tests of the startup cost of the entry points: interface.py and SMKinteraction.py must import within the
+time budget of SMKbenchmark.bench_imports (measured with python -X importtime in a fresh interpreter) and
+without loading the modules only some paths need (SMKbenchmark.DEFERRED_MODULES).
+"""
+import pytest
+
+from SMKbenchmark import bench_imports
+
+
+@pytest.mark.parametrize("module", ["interface", "SMKinteraction"])
+def test_module_imports_within_budget(module):
+    assert bench_imports((module,)) == []